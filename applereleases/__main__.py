@@ -2,9 +2,14 @@
 
 # imports
 from dotenv.main import load_dotenv
+from .utils import cluster, metrics
+from .utils.client import http
+from .utils.db import GuildConfigCache, setup_db
+from .utils.icons import icons
 from .utils.logger import logger
+from .utils.outbox import Outbox
+from .utils.sampler import Sampler
 
-import aiohttp
 import aiopath
 import aiosqlite #TODO: Move to MongoDB
 import asyncio
@@ -23,8 +28,16 @@ async def startup():
         logger.error('Bot token not set in \'AR_TOKEN\' environment variable. Exiting. (See \'.env\')')
         exit(1)
 
+    try:
+        shard_ids, shard_count = cluster.load_shards()
+    except ValueError as e:
+        logger.error(f'{e}. Exiting.')
+        exit(1)
+
     mentions = discord.AllowedMentions(everyone=False, users=False, roles=True)
     bot = discord.AutoShardedBot(
+        shard_ids=shard_ids,
+        shard_count=shard_count,
         help_command=None,
         intents=discord.Intents.default(),
         allowed_mentions=mentions,
@@ -40,25 +53,47 @@ async def startup():
 
         bot.load_extension(f'applereleases.cogs.{cog.stem}')
 
+    http.configure_executor(os.environ.get('AR_PARSE_EXECUTOR', 'process'), int(os.environ.get('AR_PARSE_WORKERS', 2)))
+
     db_path = aiopath.AsyncPath('Data/bot.db')
     await db_path.parent.mkdir(exist_ok=True)
-    async with aiosqlite.connect(db_path) as db, aiohttp.ClientSession() as session:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS roles(
-            guild INTEGER,
-            data JSON
-            )
-            ''')
-        await db.commit()
+    await http.load_cache()
+    await icons.load()
+    async with aiosqlite.connect(db_path) as db:
+        await setup_db(db)
 
         bot.db = db
-        bot.session = session
+        bot.guild_config = GuildConfigCache(db)
+        await bot.guild_config.load()
+        bot.outbox = Outbox(db, shard_ids, shard_count)
+        bot.session = http.session
+        bot.sampler = Sampler(bot)
+        bot.sampler.start()
+        metrics_server = None
 
         try:
-            await bot.start(os.environ.get('AR_TOKEN'))
+            metrics_server = await metrics.start(shard_ids)
+            if cluster.ROLE == cluster.POLLER: # Only the REST API is needed to render announcements
+                await bot.login(os.environ.get('AR_TOKEN'))
+                try:
+                    await bot.get_cog('Events').release_checker.start()
+                finally:
+                    await bot.close()
+            else:
+                await bot.start(os.environ.get('AR_TOKEN'))
         except discord.LoginFailure:
             logger.error('Token invalid, make sure the \'AR_TOKEN\' environment variable is set to your bot token. Exiting. (See \'.env\')')
             exit(1)
+        finally:
+            bot.sampler.stop()
+            events = bot.get_cog('Events')
+            if events is not None and events.stream is not None: # Ends open streams before the database closes
+                await events.stream.stop()
+            await bot.guild_config.flush()
+            await bot.outbox.flush()
+            await http.close()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
 
 def main():
     try:
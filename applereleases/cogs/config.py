@@ -6,7 +6,6 @@ from ..views.selects import DropdownView
 from ..views.buttons import PaginatorView, ReactionRoleButton
 
 import discord
-import json
 
 async def release_autocomplete(ctx: discord.AutocompleteContext) -> list: return [_ for _ in [*api.VALID_RELEASES, 'Other'] if ctx.value.lower() in _.lower()]
 
@@ -27,8 +26,7 @@ class ConfigCog(discord.Cog, name='Configuration'):
     
     @config.command(name='list', description='List current configuration settings.')
     async def list_config(self, ctx: discord.ApplicationContext) -> None:
-        async with self.bot.db.execute('SELECT data FROM roles WHERE guild = ?', (ctx.guild_id,)) as cursor:
-            roles = json.loads((await cursor.fetchone())[0])
+        roles = await self.bot.guild_config.get(ctx.guild_id)
 
         embed = {
             'title': 'Apple Releases Configuration',
@@ -77,8 +75,7 @@ class ConfigCog(discord.Cog, name='Configuration'):
             await ctx.respond(embed=invalid_embed, ephemeral=True)
             return
 
-        async with self.bot.db.execute('SELECT data FROM roles WHERE guild = ?', (ctx.guild.id,)) as cursor:
-            roles = json.loads((await cursor.fetchone())[0])
+        roles = await self.bot.guild_config.get(ctx.guild.id)
 
         options = [
             discord.SelectOption(
@@ -119,8 +116,7 @@ class ConfigCog(discord.Cog, name='Configuration'):
         else:
             roles[dropdown.answer].update({'channel': channel.id})
 
-        await self.bot.db.execute('UPDATE roles SET data = ? WHERE guild = ?', (json.dumps(roles), ctx.guild.id))
-        await self.bot.db.commit()
+        await self.bot.guild_config.set(ctx.guild.id, roles)
 
         embed = discord.Embed(title='Configuration', description=f"All {'Apple' if dropdown.answer == 'All' else dropdown.answer} releases will now be announced in: {channel.mention}")
         embed.set_footer(text=ctx.author.display_name, icon_url=ctx.author.display_avatar.with_static_format('png').url)
@@ -141,13 +137,11 @@ class ConfigCog(discord.Cog, name='Configuration'):
             await ctx.respond(embed=invalid_embed, ephemeral=True)
             return
 
-        async with self.bot.db.execute('SELECT data FROM roles WHERE guild = ?', (ctx.guild.id,)) as cursor:
-            roles = json.loads((await cursor.fetchone())[0])
+        roles = await self.bot.guild_config.get(ctx.guild.id)
 
         enabled = not roles[release].get('enabled')
         roles[release].update({'enabled': enabled})
-        await self.bot.db.execute('UPDATE roles SET data = ? WHERE guild = ?', (json.dumps(roles), ctx.guild.id))
-        await self.bot.db.commit()
+        await self.bot.guild_config.set(ctx.guild.id, roles)
 
         embed = discord.Embed(title='Configuration', description=f"**{release}** releases will {'now' if enabled else 'no longer'} be announced.")
         embed.set_footer(text=ctx.author.display_name, icon_url=ctx.author.display_avatar.with_static_format('png').url)
@@ -170,8 +164,7 @@ class ConfigCog(discord.Cog, name='Configuration'):
             await ctx.respond(embed=invalid_embed, ephemeral=True)
             return
 
-        async with self.bot.db.execute('SELECT data FROM roles WHERE guild = ?', (ctx.guild.id,)) as cursor:
-            data = json.loads((await cursor.fetchone())[0])
+        data = await self.bot.guild_config.get(ctx.guild.id)
 
         view = discord.ui.View(timeout=None)
         roles = [ctx.guild.get_role(data[_]['role']) for _ in data.keys()]
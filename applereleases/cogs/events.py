@@ -1,14 +1,17 @@
 # imports
 from discord.errors import Forbidden
 from discord.ext import commands, tasks
-from discord.utils import format_dt
-from typing import List, Union
-from ..utils import api, types, logger
-from ..views.buttons import ReactionRoleButton, SelectView
+from typing import List, Optional, Union
+from ..utils import announce, api, cluster, db, fanout, metrics, outbox, scheduler, stream, types, webhooks, logger
+from ..utils.diff import diff_releases
+from ..utils.icons import icons
+from ..utils.sources import Source
+from ..views.buttons import ReactionRoleButton
 
 import asyncio
 import discord
-import json
+import functools
+import time
 
 l = logger.logger
 
@@ -17,125 +20,213 @@ class EventsCog(discord.Cog, name='Events'):
         self.bot = bot
 
         self.utils = self.bot.get_cog('Utilities')
-        self.releases = None
-        self.release_checker.start()
+        # Source name -> releases from its last successful poll
+        self.releases: dict[str, List[Union[types.Release, types.OtherRelease]]] = dict()
+        # Fingerprints of every release recorded as seen, kept in sync with the database
+        self.seen: set[tuple] = set()
+        self.seen_sources: set[str] = set()
+        self.announce_lock = asyncio.Lock()
+        self.fanout = fanout.FanOut()
+        # Announcements go through per-channel webhooks when enabled
+        self.webhooks: Optional[webhooks.WebhookDelivery] = webhooks.WebhookDelivery(bot) if webhooks.ENABLED else None
+        # Release stream for downstream consumers, started with the checker when enabled
+        self.stream: Optional[stream.ReleaseStream] = None
+        self.scheduler = scheduler.Scheduler(api.sources, self.handle_poll, windows=scheduler.load_windows())
+        if cluster.ROLE != cluster.POLLER: # Pollers start the checker once they've logged in, as they never become ready
+            self.release_checker.start()
     
-    async def send_msgs(self, embed: dict, release: Union[types.Release, types.OtherRelease], data: dict) -> None:
-        messaged_guilds = list()
+    async def drain(self) -> None:
+        """Sends every queued delivery, coalescing those going to the same channel into one message."""
+        deliveries = await self.bot.outbox.pending()
+        if len(deliveries) == 0: # Anything left is waiting out its retry delay
+            self.bot.outbox.backlog = await self.bot.outbox.depth() > 0
+            return
 
-        for item in data:
-            if item[0] in messaged_guilds:
-                continue
+        announcements = await self.bot.outbox.announcements({_.release for _ in deliveries})
+        removed_guilds = set()
+        # Channels getting the same releases share one Batch, so it's only built once
+        batches: dict[tuple[str, ...], announce.Batch] = dict()
+        messages = list()
+        jobs = list()
 
-            roles = json.loads(item[1])
-            guild = self.bot.get_guild(item[0])
+        for group in outbox.group(deliveries, announce.MAX_EMBEDS if announce.COALESCE else 1):
+            guild_id, channel_id = group[0].guild, group[0].channel
+            guild = self.bot.get_guild(guild_id)
 
             if guild is None: # Bot isn't in guild anymore
-                l.warning(f'No longer in guild with id: {item[0]}, removing from database.')
-                await self.bot.db.execute('DELETE FROM roles WHERE guild = ?', (item[0],))
-                await self.bot.db.commit()
+                if guild_id not in removed_guilds:
+                    l.warning(f'No longer in guild with id: {guild_id}, removing from database.')
+                    await self.bot.guild_config.remove(guild_id, buffered=True)
+                    removed_guilds.add(guild_id)
 
+                await self.bot.outbox.record(group, outbox.FAILED)
+                metrics.DELIVERIES.inc(len(group), outcome='unreachable')
                 continue
 
-            os = release.type
-            if not roles[os].get('enabled') or roles[os].get('channel') is None:
-                continue
-            
-            channel = guild.get_channel(roles[os].get('channel')) # Channel is deleted/Bot doesn't have access to channel
+            channel = guild.get_channel(channel_id) # Channel is deleted/Bot doesn't have access to channel
             if channel is None:
-                l.warning(f"Channel with id: {roles[os].get('channel')} is no longer accessible in guild: {guild.id}, disabling {os} releases for guild.")
-
-                roles[os]['enabled'] = False
-                await self.bot.db.execute('UPDATE roles SET data = ? WHERE guild = ?', (json.dumps(roles), guild.id))
-                await self.bot.db.commit()
+                for os in dict.fromkeys(announcements[_.release].release.type for _ in group):
+                    l.warning(f"Channel with id: {channel_id} is no longer accessible in guild: {guild.id}, disabling {os} releases for guild.")
+                    await self.bot.guild_config.disable(guild.id, os, buffered=True)
 
+                await self.bot.outbox.record(group, outbox.FAILED)
+                metrics.DELIVERIES.inc(len(group), outcome='unreachable')
                 continue
 
-            try:
-                if os in api.VALID_RELEASES:
-                    button = [{
-                        'label': 'Link',
-                        'style': discord.ButtonStyle.link,
-                        'url': release.link
-                    }]
-                    await channel.send(content=await release.ping(self.bot, guild), embed=discord.Embed.from_dict(embed), view=SelectView(button, context=None, public=True, timeout=None))
-                else:
-                    await channel.send(content=await release.ping(self.bot, guild), embed=discord.Embed.from_dict(embed))
-                if type(os) == types.Release:
+            batch_key = tuple(_.release for _ in group)
+            if batch_key not in batches:
+                batches[batch_key] = announce.Batch([announcements[_] for _ in batch_key])
+
+            nonce = group[0].nonce or outbox.make_nonce(group)
+            messages.append((nonce, group))
+            jobs.append((channel.id, functools.partial(self.send_msg, batches[batch_key], guild, channel, [guild.get_role(_.role) for _ in group], group, nonce)))
+
+        await self.bot.outbox.start(messages)
+
+        versions = list(dict.fromkeys(_.release.version for _ in announcements.values()))
+        name = versions[0] if len(versions) == 1 else f'{len(versions)} releases'
+        await self.fanout.run(jobs, f'{name} fan-out')
+        await self.bot.outbox.finish()
+        await self.bot.guild_config.flush()
+
+    async def send_msg(self, batch: announce.Batch, guild: discord.Guild, channel: discord.TextChannel, roles: List[Optional[discord.Role]], deliveries: List[outbox.Delivery], nonce: str) -> bool:
+        backend = 'webhook' if self.webhooks is not None else 'channel'
+        start = time.perf_counter()
+        try:
+            if self.webhooks is not None:
+                await self.webhooks.send(guild, channel, batch.payload(roles), nonce)
+            else:
+                await channel.send(**batch.payload(roles), nonce=nonce, enforce_nonce=True) # Retries of the same message are dropped by Discord
+            metrics.SEND_SECONDS.observe(time.perf_counter() - start, backend=backend, outcome='sent')
+            for release in batch.releases:
+                if isinstance(release, types.Release):
                     l.info(f'Sent {release.version} ({release.build_number}) release to guild: {guild.name}, channel: #{channel.name}.')
                 else:
                     l.info(f'Sent {release.version} release to guild: {guild.name}, channel: #{channel.name}.')
-            except Forbidden:
+        except Forbidden:
+            metrics.SEND_SECONDS.observe(time.perf_counter() - start, backend=backend, outcome='forbidden')
+            metrics.DELIVERIES.inc(len(deliveries), outcome='failed')
+            for os in dict.fromkeys(_.type for _ in batch.releases):
                 l.warning(f'Unable to send {os} releases to channel: #{channel.name} in guild: {guild.name}, disabling {os} releases for guild.')
+                await self.bot.guild_config.disable(guild.id, os, buffered=True)
 
-                roles[os]['enabled'] = False
-                await self.bot.db.execute('UPDATE roles SET data = ? WHERE guild = ?', (json.dumps(roles), guild.id))
-                await self.bot.db.commit()
+            await self.bot.outbox.record(deliveries, outbox.FAILED)
+            return False
+        except Exception:
+            metrics.SEND_SECONDS.observe(time.perf_counter() - start, backend=backend, outcome='error')
+            raise
 
-            except Exception as e:
-                l.error(f'Failed to send {release.version} ({release.build_number}) release to channel: #{channel.name} in guild: {guild.name} with error: {e}')
+        await self.bot.outbox.record(deliveries, outbox.SENT)
+        metrics.DELIVERIES.inc(len(deliveries), outcome='sent')
+        now = time.time()
+        for delivery in deliveries:
+            if delivery.created is not None:
+                metrics.DELIVERY_LATENCY.observe(now - delivery.created)
 
-            messaged_guilds.append(guild.id)
-            await asyncio.sleep(1)
+        return True
 
     @tasks.loop()
     async def release_checker(self) -> None:
-        await self.bot.wait_until_ready()
+        if cluster.ROLE != cluster.POLLER:
+            await self.bot.wait_until_ready()
 
-        if self.releases is None:
-            l.info('Populating release cache...')
-            self.releases = await api.fetch_releases()
-            #self.releases = []
-            l.info('Release cache populated, sleeping.')
-            await asyncio.sleep(120)
+        if cluster.ROLE == cluster.WORKER: # Apple is polled by the cluster's poller, only deliver to this worker's guilds
+            await self.deliver_queued()
             return
-        
-        firmwares: types.ComparedFirmwares = await api.compare_releases(self.releases) # Check for any new firmwares
-        diff: List[Union[types.Release, types.OtherRelease]] = firmwares.differences
-        if len(diff) > 0:
-            l.info(f"{len(diff)} new release{'s' if len(diff) > 1 else ''} detected!")
-            self.releases: List[Union[types.Release, types.OtherRelease]] = firmwares.firmwares # Replace cached firmwares with new ones
-
-            for release in diff:
-                embed = {
-                    'title': 'New Release',
-                    'description': release.version,
-                    'color': int(discord.Color.blurple()),
-                    'thumbnail': {
-                        'url': ''
-                    },
-                    'fields': [],
-                    'footer': {
-                        'text': 'Apple Releases • Made by m1sta and Jaidan',
-                        'icon_url': str(self.bot.user.display_avatar.with_static_format('png').url)
-                    }
-                }
-                
-                if release.type in api.VALID_RELEASES:
-                    embed['fields'].append({
-                            'name': 'Release Date',
-                            'value': format_dt(release.date),
-                            'inline': False
-                        })
-                    embed['fields'].append({
-                            'name': 'Build Number',
-                            'value': release.build_number,
-                            'inline': False
-                        })
-                
-                if type(release) == types.Release:
-                    embed['thumbnail']['url'] = await release.get_icon()
-                else:
-                    embed['thumbnail']['url'] = release.img
-
-                async with self.bot.db.execute('SELECT * FROM roles') as cursor:
-                    data = await cursor.fetchall()
-                    
-                await self.send_msgs(embed, release, data)
 
-            l.info('Finished sending new releases.')
-
-        await asyncio.sleep(120)
+        if stream.PORT is not None and self.stream is None:
+            self.stream = stream.ReleaseStream(self.bot.db, lambda: self.releases)
+            await self.stream.start(stream.HOST, int(stream.PORT))
+
+        l.info('Populating release cache...')
+        self.seen = await db.load_seen(self.bot.db)
+        self.seen_sources = {_[3] for _ in self.seen}
+
+        if cluster.ROLE == cluster.STANDALONE:
+            async with self.announce_lock: # Resume deliveries interrupted by a restart
+                await self.drain()
+
+        await self.scheduler.run()
+
+    async def deliver_queued(self) -> None:
+        """Drains the outbox whenever another process commits to the database, retrying failed deliveries periodically."""
+        l.info(f'Delivering queued releases for shards: {self.bot.outbox.shard_ids}.')
+        version = None
+        last_drain = 0
+        while True:
+            current = await cluster.data_version(self.bot.db)
+            if current != version or (self.bot.outbox.backlog and time.monotonic() - last_drain >= cluster.RETRY_INTERVAL):
+                version = current
+                last_drain = time.monotonic()
+                try:
+                    async with self.announce_lock: # Failed deliveries are only due once their retry delay has passed, see `Outbox.pending`
+                        await self.drain()
+                except Exception as e: # Keep delivering, whatever is left is retried on the next drain
+                    l.error(f'Failed to deliver queued releases with error: {e!r}')
+
+            await asyncio.sleep(cluster.WAKE_INTERVAL)
+
+    async def handle_poll(self, source: Source, releases: List[Union[types.Release, types.OtherRelease]], status: types.SourceStatus) -> bool:
+        if not status.ok: # Keep the previous releases, so they aren't announced again once the source recovers
+            return False
+
+        previous = self.releases.get(source.name)
+        with metrics.COMPARE_SECONDS.time(source=source.name):
+            if previous is None:
+                # Compare the first fetch against what was seen before the restart
+                diff: List[Union[types.Release, types.OtherRelease]] = [_ for _ in releases if _.fingerprint not in self.seen]
+            else:
+                # Check for any new firmwares, entries that drop out of a poll & come back aren't new
+                diff: List[Union[types.Release, types.OtherRelease]] = [_ for _ in diff_releases(previous, releases).added if _.fingerprint not in self.seen]
+
+        detected = time.time()
+        if previous is None:
+            l.info(f'[{source.name}] Release cache populated.')
+
+        async with self.announce_lock:
+            # Releases from sources that have never been seen (first run, new sources) are recorded without being announced
+            baseline = [_ for _ in diff if _.source not in self.seen_sources]
+            if len(baseline) > 0:
+                diff = [_ for _ in diff if _.source in self.seen_sources]
+                await db.mark_seen(self.bot.db, baseline)
+                self.seen.update(_.fingerprint for _ in baseline)
+                self.seen_sources.update(_.source for _ in baseline)
+                l.info(f"Recorded {len(baseline)} release{'s' if len(baseline) > 1 else ''} from new sources without announcing.")
+
+            if len(diff) > 0:
+                l.info(f"{len(diff)} new release{'s' if len(diff) > 1 else ''} detected!")
+                await self.announce(diff, detected)
+
+                l.info('Finished sending new releases.')
+            elif self.bot.outbox.backlog and cluster.ROLE == cluster.STANDALONE: # Retry deliveries that failed last time
+                await self.drain()
+
+        # Replace cached firmwares with new ones only once they're queued, if anything above raised they're detected again next poll
+        self.releases[source.name] = releases
+        return len(diff) > 0
+
+    async def announce(self, diff: List[Union[types.Release, types.OtherRelease]], detected: Optional[float]=None) -> None:
+        await icons.prefetch(_.link for _ in diff if isinstance(_, types.Release))
+
+        footer_icon = str(self.bot.user.display_avatar.with_static_format('png').url)
+        announcements = [await announce.render(_, footer_icon) for _ in diff]
+
+        subscribers = dict()
+        for os in dict.fromkeys(_.type for _ in diff):
+            if cluster.ROLE == cluster.POLLER: # Guild configs are changed by the workers, read them from the database
+                subscribers[os] = await db.get_subscribers(self.bot.db, os)
+            else:
+                subscribers[os] = self.bot.guild_config.subscribers(os)
+
+        # Queued in the same transaction that marks the releases as seen, then delivered from the outbox
+        queued = await self.bot.outbox.enqueue(announcements, subscribers, detected)
+        self.seen.update(_.fingerprint for _ in diff)
+        l.info(f"Queued {queued} deliver{'ies' if queued != 1 else 'y'}.")
+        if self.stream is not None:
+            await self.stream.notify()
+
+        if cluster.ROLE == cluster.STANDALONE: # Workers pick up the deliveries in cluster mode
+            await self.drain()
 
     @discord.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild) -> None:
@@ -212,21 +303,18 @@ class EventsCog(discord.Cog, name='Events'):
             'enabled': True
         }
 
-        await self.bot.db.execute('INSERT INTO roles(guild, data) VALUES(?,?)', (guild.id, json.dumps(roles)))
-        await self.bot.db.commit()
+        await self.bot.guild_config.set(guild.id, roles)
 
     @discord.Cog.listener()
     async def on_guild_remove(self, guild: discord.Guild) -> None:
         await self.bot.wait_until_ready()
 
-        await self.bot.db.execute('DELETE FROM roles WHERE guild = ?', (guild.id,))
-        await self.bot.db.commit()
+        await self.bot.guild_config.remove(guild.id)
 
     @discord.Cog.listener()
     async def on_ready(self) -> None:
         for guild in self.bot.guilds:
-            async with self.bot.db.execute('SELECT data FROM roles WHERE guild = ?', (guild.id,)) as cursor:
-                data = json.loads((await cursor.fetchone())[0])
+            data = await self.bot.guild_config.get(guild.id)
 
             view = discord.ui.View(timeout=None)
 
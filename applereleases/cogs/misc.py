@@ -4,6 +4,7 @@ from discord.commands import slash_command
 from discord.ext import commands
 from discord.utils import format_dt
 from math import floor
+from typing import Optional
 from ..views.buttons import SelectView
 
 import asyncio
@@ -11,6 +12,11 @@ import discord
 import psutil
 import sys
 
+# Shards listed individually in /stats, the rest are summarised
+MAX_SHARDS_SHOWN = 10
+
+def format_ms(seconds: Optional[float]) -> str: return f'{seconds * 1000:.1f}ms' if seconds is not None else 'N/A'
+
 class MiscCog(commands.Cog, name='Miscellaneous'):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -73,7 +79,8 @@ class MiscCog(commands.Cog, name='Miscellaneous'):
                 'name': 'Memory Usage',
                 'value': f'{floor(process.memory_info().rss/1000000)} MB',
                 'inline': False
-            }],
+            },
+            *self.performance_fields()],
             'footer': {
                 'text': ctx.author.display_name,
                 'icon_url': str(ctx.author.display_avatar.with_static_format('png').url)
@@ -82,6 +89,55 @@ class MiscCog(commands.Cog, name='Miscellaneous'):
 
         await ctx.respond(embed=embed, ephemeral=True)
 
+    def performance_fields(self) -> list[dict]:
+        """Builds the performance fields of `/stats` from the sampler's latest snapshot, nothing is measured here."""
+        sampler = self.bot.sampler
+        fields = [{
+            'name': 'Event Loop Lag',
+            'value': f'p50: `{format_ms(sampler.lag_percentile(0.5))}`, p99: `{format_ms(sampler.lag_percentile(0.99))}`',
+            'inline': False
+        }]
+
+        if len(sampler.latencies) > 0:
+            shards = sorted(sampler.latencies.items())
+            value = '\n'.join(f'Shard {shard}: `{format_ms(latency)}`' for shard, latency in shards[:MAX_SHARDS_SHOWN])
+            if len(shards) > MAX_SHARDS_SHOWN:
+                value += f'\n...and {len(shards) - MAX_SHARDS_SHOWN} more (max `{format_ms(max(_[1] for _ in shards))}`)'
+
+            fields.append({'name': 'Shard Latency', 'value': value, 'inline': False})
+
+        if len(sampler.polls) > 0:
+            fields.append({
+                'name': 'Last Polls',
+                'value': '\n'.join(f"{source}: `{format_ms(duration)}`{'' if ok else ' (failed)'}" for source, (duration, ok) in sampler.polls.items()),
+                'inline': False
+            })
+
+        if sampler.fanout is not None:
+            fields.append({
+                'name': 'Last Fan-out',
+                'value': f'`{sampler.fanout.sent}/{sampler.fanout.total}` messages in `{sampler.fanout.elapsed:.1f}s` (`{sampler.fanout.throughput:.1f}` msg/s)',
+                'inline': False
+            })
+
+        fields.extend(({
+            'name': 'Outbox Depth',
+            'value': str(sampler.outbox_depth) if sampler.outbox_depth is not None else 'N/A',
+            'inline': True
+        },
+        {
+            'name': 'DB Queries',
+            'value': f'{sampler.db_rate:.1f}/s',
+            'inline': True
+        },
+        {
+            'name': 'Cache Hit Rates',
+            'value': '\n'.join(f"{name}: `{f'{rate:.0%}' if rate is not None else 'N/A'}`" for name, rate in sampler.hit_rates.items()) or 'N/A',
+            'inline': False
+        }))
+
+        return fields
+
 
 def setup(bot):
     bot.add_cog(MiscCog(bot))
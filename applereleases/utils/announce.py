@@ -0,0 +1,153 @@
+# imports
+from discord.utils import format_dt
+from typing import Optional, Sequence, Union
+from . import api, types
+from ..views.buttons import SelectView
+
+import discord
+import os
+
+FOOTER = 'Apple Releases • Made by m1sta and Jaidan'
+# Discord's limit on embeds per message
+MAX_EMBEDS = 10
+# Devices listed in an announcement before the rest are summarised
+MAX_DEVICES = 20
+# Group releases from the same poll that go to the same channel into one message, disabled with AR_COALESCE=0
+COALESCE = os.environ.get('AR_COALESCE', '1') != '0'
+
+class Announcement():
+    """A release announcement, rendered once and shared by every guild it's sent to."""
+    __slots__ = ('release', 'embed', 'view')
+
+    def __init__(self, release: Union[types.Release, types.OtherRelease], embed: discord.Embed, view: Optional[discord.ui.View]):
+        self.release = release
+        self.embed = embed
+        # Link-only views aren't dispatchable, so a single instance can be attached to any number of messages
+        self.view = view
+
+    def content(self, role: Optional[discord.Role]) -> Optional[str]: return role.mention if role is not None else None
+
+    def to_dict(self) -> dict:
+        """Serializes the rendered announcement, so it can be sent again after a restart without re-rendering."""
+        return {
+            'kind': type(self.release).__name__,
+            'release': self.release.to_dict(),
+            'embed': self.embed.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Announcement':
+        release = RELEASE_KINDS[data['kind']].from_dict(data['release'])
+        return cls(release, discord.Embed.from_dict(data['embed']), link_view(release))
+
+    def payload(self, role: Optional[discord.Role]) -> dict:
+        """Keyword arguments for `channel.send`, only the content differs between guilds."""
+        if self.view is None:
+            return {'content': self.content(role), 'embed': self.embed}
+
+        return {'content': self.content(role), 'embed': self.embed, 'view': self.view}
+
+RELEASE_KINDS = {_.__name__: _ for _ in (types.Release, types.OtherRelease)}
+
+class Batch():
+    """Announcements coalesced into a single message, up to `MAX_EMBEDS` of them."""
+    __slots__ = ('announcements', 'embeds', 'view')
+
+    def __init__(self, announcements: Sequence[Announcement]):
+        self.announcements = tuple(announcements[:MAX_EMBEDS])
+        self.embeds = [_.embed for _ in self.announcements]
+
+        links = [_.release for _ in self.announcements if _.view is not None]
+        if len(self.announcements) == 1:
+            self.view = self.announcements[0].view
+        elif len(links) > 0: # One link button per release, labelled with its version
+            buttons = [{
+                'label': _.version[:80],
+                'style': discord.ButtonStyle.link,
+                'url': _.link
+            } for _ in links]
+            self.view = SelectView(buttons, context=None, public=True, timeout=None)
+        else:
+            self.view = None
+
+    @property
+    def releases(self) -> list[Union[types.Release, types.OtherRelease]]: return [_.release for _ in self.announcements]
+
+    def content(self, roles: Sequence[Optional[discord.Role]]) -> Optional[str]:
+        mentions = dict.fromkeys(_.mention for _ in roles if _ is not None) # Keeps order, drops duplicates
+        return ' '.join(mentions) if len(mentions) > 0 else None
+
+    def payload(self, roles: Sequence[Optional[discord.Role]]) -> dict:
+        """Keyword arguments for `channel.send`, only the content differs between guilds."""
+        if len(self.announcements) == 1:
+            return self.announcements[0].payload(roles[0])
+
+        if self.view is None:
+            return {'content': self.content(roles), 'embeds': self.embeds}
+
+        return {'content': self.content(roles), 'embeds': self.embeds, 'view': self.view}
+
+async def render(release: Union[types.Release, types.OtherRelease], footer_icon: str) -> Announcement:
+    embed = {
+        'title': 'New Release',
+        'description': release.version,
+        'color': int(discord.Color.blurple()),
+        'thumbnail': {
+            'url': ''
+        },
+        'fields': [],
+        'footer': {
+            'text': FOOTER,
+            'icon_url': footer_icon
+        }
+    }
+
+    if release.type in api.VALID_RELEASES:
+        embed['fields'].append({
+                'name': 'Release Date',
+                'value': format_dt(release.date),
+                'inline': False
+            })
+        embed['fields'].append({
+                'name': 'Build Number',
+                'value': release.build_number,
+                'inline': False
+            })
+
+    if type(release) == types.OtherRelease:
+        if release.firmware is not None:
+            embed['fields'].append({
+                    'name': 'Firmware Version',
+                    'value': release.firmware,
+                    'inline': False
+                })
+
+        devices = release.devices or release.models
+        if len(devices) > 0:
+            embed['fields'].append({
+                    'name': 'Devices',
+                    'value': format_devices(devices),
+                    'inline': False
+                })
+
+    if type(release) == types.Release:
+        embed['thumbnail']['url'] = await release.get_icon()
+    else:
+        embed['thumbnail']['url'] = release.img
+
+    return Announcement(release, discord.Embed.from_dict(embed), link_view(release))
+
+def format_devices(devices: Sequence[str]) -> str:
+    listed = ', '.join(devices[:MAX_DEVICES])
+    return listed if len(devices) <= MAX_DEVICES else f'{listed} and {len(devices) - MAX_DEVICES} more'
+
+def link_view(release: Union[types.Release, types.OtherRelease]) -> Optional[discord.ui.View]:
+    if release.type not in api.VALID_RELEASES:
+        return
+
+    button = [{
+        'label': 'Link',
+        'style': discord.ButtonStyle.link,
+        'url': release.link
+    }]
+    return SelectView(button, context=None, public=True, timeout=None)
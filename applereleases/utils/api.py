@@ -1,13 +1,19 @@
 # imports
+from . import metrics
+from .client import http
 from .logger import logger
-from .types import OtherRelease, Release, ComparedFirmwares
+from .parsers import MAX_ASSETS, parse_plist, parse_rss
+from .sources import Source, load_sources
+from .types import OtherRelease, Release, SourceStatus
 from aiopath import AsyncPath
-from typing import Union
+from typing import Optional, Union
 
 import aiofiles
 import aiohttp
-import bs4
-import plistlib
+import asyncio
+import contextlib
+import functools
+import time
 
 VALID_RELEASES = (
     'iOS',
@@ -17,145 +23,106 @@ VALID_RELEASES = (
     'watchOS'
 )
 
-map = [
-    {
-        'name': 'AirTag Firmware',
-        'xml': 'https://mesu.apple.com/assets/com_apple_MobileAsset_MobileAccessoryUpdate_DurianFirmware/com_apple_MobileAsset_MobileAccessoryUpdate_DurianFirmware.xml',
-        'img': 'https://www.att.com/catalog/en/idse/Apple/Apple%20AirTag/White%20_1%20Pack_-hero-zoom.png'
-    },
-    {
-        'name': 'audioOS',
-        'xml': 'https://mesu.apple.com/assets/audio/com_apple_MobileAsset_SoftwareUpdate/com_apple_MobileAsset_SoftwareUpdate.xml',
-        'img': 'https://help.apple.com/assets/61608C271E13E80A1C5310CE/61608C291E13E80A1C5310D8/en_US/03d850c212af22000d02c97705cf6704.png'
-    },
-    {
-        'name': 'AirPods 1 and 2 Firmware',
-        'xml': 'https://mesu.apple.com/assets/com_apple_MobileAsset_MobileAccessoryUpdate_A2032_EA/com_apple_MobileAsset_MobileAccessoryUpdate_A2032_EA.xml',
-        'img': 'https://help.apple.com/assets/6305096F029A2032C16D3326/63050972029A2032C16D332F/en_US/ee1c9de8c19be64e5246f6a410ec443a.png'
-    },
-    {
-        'name': 'AirPods Pro Firmware',
-        'xml': 'https://mesu.apple.com/assets/com_apple_MobileAsset_MobileAccessoryUpdate_A2084_EA/com_apple_MobileAsset_MobileAccessoryUpdate_A2084_EA.xml',
-        'img': 'https://help.apple.com/assets/6305096F029A2032C16D3326/63050972029A2032C16D332F/en_US/af04ba25533b325869157fd1fd66e488.png'
-    },
-    {
-        'name': 'AirPods 3 Firmware',
-        'xml': 'https://mesu.apple.com/assets/com_apple_MobileAsset_MobileAccessoryUpdate_A2564_EA/com_apple_MobileAsset_MobileAccessoryUpdate_A2564_EA.xml',
-        'img': 'https://www.att.com/catalog/en/idse/Apple/Apple%20AirPods%20_3rd%20generation_/White-hero-zoom.png'
-    },
-    {
-        'name': 'AirPods Max Firmware',
-        'xml': 'https://mesu.apple.com/assets/com_apple_MobileAsset_MobileAccessoryUpdate_A2096_EA/com_apple_MobileAsset_MobileAccessoryUpdate_A2096_EA.xml',
-        'img': 'https://help.apple.com/assets/6305096F029A2032C16D3326/63050972029A2032C16D332F/en_US/b9f519195f84950573eea5088a49b964.png'
-    }
-]
+# Maximum number of sources fetched at once
+FETCH_CONCURRENCY = 8
+# Seconds a single attempt at fetching a source may take
+FETCH_TIMEOUT = 30
+# Extra attempts made when fetching a source fails with a network error or timeout
+FETCH_RETRIES = 2
+# Seconds waited before the first retry, doubled for each one after
+RETRY_BACKOFF = 1
+
+sources: list[Source] = load_sources()
 
 async def rss(url: str):
     if await AsyncPath(url).is_file():
-        async with aiofiles.open(url) as f:
-            r = await f.read()
-
-    else:
-        try:
-            async with aiohttp.ClientSession() as session, session.get(url) as resp:
-                r = await resp.text()
-
-        except Exception:
-            logger.error('[RSS] Error fetching the URL: ', url)
+        async with aiofiles.open(url, 'rb') as f:
+            return parse_rss(await f.read())
 
     try:
-        soup = bs4.BeautifulSoup(r, features='xml')
+        return await http.fetch(url, functools.partial(parse_rss, known=http.cached(url)), offload=True)
     except Exception:
-        logger.error('Could not parse the RSS: ', url)
-
-    articles = [
-            {
-                'title': a.find('title').text,
-                'link': a.find('link').text,
-                'description': a.find('description').text,
-                'pubdate': a.find('pubDate').text
-            }
-        for a in soup.findAll('item')
-    ]
-
-    return articles
+        logger.error(f'[RSS] Error fetching the URL: {url}')
+        raise
 
-async def xml(obj: dict):
+async def xml(source: Source):
     try:
-        async with aiohttp.ClientSession() as session, session.get(obj.get('xml')) as resp:
-            try:
-                plist = plistlib.loads(await resp.read())
-            except Exception:
-                logger.error('Could not parse the XMML: ', obj.get('xml'))
- 
+        catalog = await http.fetch(source.url, parse_plist, offload=True)
     except Exception:
-        logger.error('[XML] Error fetching the URL: ', obj.get('xml'))
+        logger.error(f'[XML] Error fetching the URL: {source.url}')
+        raise
 
-    for _ in plist['Assets']:
-        if _['Build'] is None is None or _['__BaseURL'] is None:
-            pass
-        else:
-            return {
-                'version': _['Build'],
-                'zip': _['__BaseURL'] + _['__RelativePath'],
-                'orig': obj
-            }
-    
-    return
+    if catalog['skipped'] > 0:
+        logger.warning(f"[{source.name}] Catalog has more than {MAX_ASSETS} builds, {catalog['skipped']} asset(s) past the limit were skipped.")
+
+    return [{**asset, 'orig': source} for asset in catalog['assets']]
 
-def format_feed(feed: list) -> list[Release]:
+def format_feed(feed: list, source: str) -> list[Release]:
     """Formats recieved RSS entries into an interable list of Release objects.
     
     Args:
         feed (list): List of RSS entries.
+        source (str): Name of the source the entries came from.
     Returns:
-        
+        List of Release objects.
     """
 
     # Return what we found
-    return [Release(item) for item in feed]
+    return [Release(item, source) for item in feed]
 
-def format_feed_xml(feed: dict) -> list[OtherRelease]:
-    """Formats recieved XML entry into an OtherRelease object.
+def format_feed_xml(feed: list) -> list[OtherRelease]:
+    """Formats recieved XML entries into an interable list of OtherRelease objects.
     
     Args:
-        feed (list): XML entry.
+        feed (list): List of XML entries.
     Returns:
-        
+        List of OtherRelease objects.
     """
 
     # Return what we found
-    return OtherRelease(feed)
+    return [OtherRelease(item) for item in feed]
 
-async def fetch_releases() -> list[Union[Release, OtherRelease]]:
-    """Fetches all (recent) Apple releases.
-    
-    Returns:
-        List of recent Apple releases.
-    """
-    # Add normal releases
-    releases: list[Union[Release, OtherRelease]] = format_feed(await rss('https://developer.apple.com/news/releases/rss/releases.rss'))
-    # Add other releases
-    for item in map:
-        releases.append(format_feed_xml(await xml(item)))
-    return releases
-
-async def compare_releases(to_compare: list[Union[Release, OtherRelease]]) -> ComparedFirmwares:
-    """Compares already fetched release list to the current releases.
+async def fetch_source(source: Source, semaphore: Optional[asyncio.Semaphore]=None, timeout: float=FETCH_TIMEOUT, retries: int=FETCH_RETRIES) -> tuple[list[Union[Release, OtherRelease]], SourceStatus]:
+    """Fetches a single source, never raising.
     
     Args:
-        to_compare (dict): Dictionary object of releases.
+        source (Source): Source to fetch.
+        semaphore (asyncio.Semaphore): Semaphore capping concurrent fetches.
+        timeout (float): Seconds each attempt may take.
+        retries (int): Extra attempts made after network errors & timeouts.
     Returns:
-        Releases in recent list that weren't in previous.
+        The source's releases (empty on failure) and its status.
     """
-    # Get all releases from the API
-    releases = await fetch_releases()
-    # Initialize array for differences
-    differences = []
-    
-    for release in releases:
-        if list(filter(lambda x: x.version == release.version, to_compare)) == []:
-            differences.append(release)
+    async def fetch() -> list[Union[Release, OtherRelease]]:
+        if source.parser == 'rss':
+            return format_feed(await rss(source.url), source.name)
+        else:
+            return format_feed_xml(await xml(source))
+
+    async with semaphore or contextlib.nullcontext():
+        start = time.monotonic()
+        for attempt in range(retries + 1):
+            try:
+                releases = await asyncio.wait_for(fetch(), timeout)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = 'Timed out' if isinstance(e, asyncio.TimeoutError) else repr(e)
+                if attempt < retries and not (isinstance(e, aiohttp.ClientResponseError) and e.status < 500):
+                    await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                    continue
+            except Exception as e:
+                error = repr(e)
+
+            elapsed = time.monotonic() - start
+            metrics.FETCH_SECONDS.observe(elapsed, source=source.name, status='error')
+            logger.error(f'[{source.name}] Failed to fetch releases after {attempt + 1} attempt(s) in {elapsed:.2f}s: {error}')
+            return [], SourceStatus(source.name, source.url, False, elapsed, error)
+
+    elapsed = time.monotonic() - start
+    metrics.FETCH_SECONDS.observe(elapsed, source=source.name, status='ok')
+    try:
+        await http.save_cache()
+    except Exception as e: # The cache is written again later, the fetch itself succeeded
+        logger.warning(f'[{source.name}] Failed to write the HTTP cache with error: {e!r}')
 
-    # Compare the old & new release lists
-    return ComparedFirmwares(differences, releases)
+    return releases, SourceStatus(source.name, source.url, True, elapsed)
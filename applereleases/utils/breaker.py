@@ -0,0 +1,54 @@
+# imports
+from typing import Optional
+
+import time
+
+# Failures in a row that open the circuit
+FAILURE_THRESHOLD = 3
+# Seconds an open circuit waits before letting a trial request through
+RESET_TIMEOUT = 300
+
+class CircuitBreaker():
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold: int=FAILURE_THRESHOLD, reset_timeout: float=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        # Failures in a row
+        self.failures: int = 0
+        # Monotonic time the circuit was opened at
+        self.opened_at: Optional[float] = None
+        # Error from the last failure
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+
+        return self.HALF_OPEN if time.monotonic() - self.opened_at >= self.reset_timeout else self.OPEN
+
+    def allow(self) -> bool:
+        """Returns whether a request may be made."""
+        return self.state != self.OPEN
+
+    def retry_in(self) -> float:
+        """Returns the seconds until an open circuit lets a trial request through."""
+        if self.opened_at is None:
+            return 0
+
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+
+    def record_failure(self, error: Optional[str]=None) -> None:
+        self.failures += 1
+        self.last_error = error
+        # A failed trial request re-opens the circuit straight away
+        if self.failures >= self.threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
@@ -0,0 +1,225 @@
+# imports
+from . import metrics
+from .logger import logger
+from aiopath import AsyncPath
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import aiofiles
+import aiofiles.os
+import aiohttp
+import asyncio
+import json
+import multiprocessing
+import time
+
+# Maximum number of open connections across all hosts
+CONNECTION_LIMIT = 100
+# Maximum number of open connections to a single host
+CONNECTION_LIMIT_PER_HOST = 8
+# Seconds resolved hostnames are cached for
+DNS_CACHE_TTL = 600
+# Seconds idle connections are kept alive for, longer than the polling interval so they get reused
+KEEPALIVE_TIMEOUT = 150
+
+TIMEOUT = aiohttp.ClientTimeout(total=60, connect=10, sock_read=30)
+
+# Validators and parsed responses are persisted here between restarts
+CACHE_PATH = 'Data/http_cache.json'
+# Bumped whenever a parser's output changes, discarding responses cached in the old format
+CACHE_VERSION = 3
+# Seconds between writes of the cache, it's always written on shutdown
+CACHE_SAVE_INTERVAL = 60
+
+# Parse workers are started from a clean server process, forking the bot once its SQLite & logging threads exist can deadlock
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Modules the fork server imports once, so each worker starts with the parsers loaded
+PRELOAD_MODULES = ['applereleases.utils.parsers']
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    context = multiprocessing.get_context(START_METHOD)
+    if START_METHOD == 'forkserver':
+        context.set_forkserver_preload(PRELOAD_MODULES)
+
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+# Executors responses can be parsed in, keeping heavy parsing off the event loop
+EXECUTORS = {
+    'process': process_pool,
+    'thread': ThreadPoolExecutor
+}
+
+class HTTPClient():
+    def __init__(self, cache_path: str=CACHE_PATH):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._api_session: Optional[aiohttp.ClientSession] = None
+        # Conditional GET cache, keyed by URL
+        self._cache: dict[str, dict] = dict()
+        self._cache_path = AsyncPath(cache_path)
+        self._cache_dirty = False
+        self._cache_saved: float = 0
+        # Sources are fetched concurrently, only one of them writes the cache at a time
+        self._save_lock = asyncio.Lock()
+        # Executor offloaded parsing runs in, None parses on the event loop
+        self.executor: Optional[Executor] = None
+
+    def configure_executor(self, kind: str, workers: int) -> None:
+        """Sets up the executor offloaded parsing runs in.
+
+        Args:
+            kind (str): 'process', 'thread' or 'none' to parse on the event loop.
+            workers (int): Number of workers.
+        """
+        if kind not in (*EXECUTORS.keys(), 'none'):
+            raise ValueError(f'Invalid parse executor: {kind}')
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+        self.executor = EXECUTORS[kind](max_workers=workers) if kind != 'none' else None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Returns the shared client session, creating it on first use.
+
+        Must be accessed from within a running event loop.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=CONNECTION_LIMIT,
+                limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                use_dns_cache=True,
+                keepalive_timeout=KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=TIMEOUT, raise_for_status=True)
+
+        return self._session
+
+    @property
+    def api_session(self) -> aiohttp.ClientSession:
+        """Returns a session sharing the pooled connections that doesn't raise on error statuses.
+
+        Used by clients that handle status codes & rate limits themselves, like webhooks.
+        Must be accessed from within a running event loop.
+        """
+        if self._api_session is None or self._api_session.closed or self._api_session.connector is not self.session.connector:
+            self._api_session = aiohttp.ClientSession(connector=self.session.connector, connector_owner=False, timeout=TIMEOUT)
+
+        return self._api_session
+
+    async def fetch(self, url: str, parse: Callable[[bytes], Any], *, offload: bool=False) -> Any:
+        """Fetches and parses a URL, skipping both when it hasn't changed since the last fetch.
+
+        The parsed result must be JSON serializable, as it's persisted alongside the URL's validators.
+
+        Args:
+            url (str): URL to fetch.
+            parse (Callable): Function parsing the response body, must be picklable when offloaded to a process pool.
+            offload (bool): Parse in the configured executor rather than on the event loop.
+        Returns:
+            The parsed response, or the previously parsed response if the server replied with 304 Not Modified.
+        """
+        cached = self._cache.get(url)
+        headers = dict()
+        if cached is not None:
+            if cached.get('etag') is not None:
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified') is not None:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        async with self.session.get(url, headers=headers) as resp:
+            if resp.status == 304 and cached is not None:
+                metrics.NOT_MODIFIED.inc()
+                return cached['data']
+
+            body = await resp.read()
+            etag = resp.headers.get('ETag')
+            last_modified = resp.headers.get('Last-Modified')
+
+        with metrics.PARSE_SECONDS.time(parser=getattr(parse, 'func', parse).__name__):
+            if offload and self.executor is not None:
+                data = await asyncio.get_running_loop().run_in_executor(self.executor, parse, body)
+            else:
+                data = parse(body)
+
+        if etag is not None or last_modified is not None:
+            self._cache[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'data': data
+            }
+            self._cache_dirty = True
+
+        elif self._cache.pop(url, None) is not None:
+            self._cache_dirty = True
+
+        return data
+
+    def cached(self, url: str) -> Any:
+        """Returns the last parsed response for a URL, or None if it isn't cached."""
+        cached = self._cache.get(url)
+        return cached['data'] if cached is not None else None
+
+    async def load_cache(self) -> None:
+        """Loads the conditional GET cache from disk."""
+        if not await self._cache_path.is_file():
+            return
+
+        try:
+            async with aiofiles.open(self._cache_path) as f:
+                cache = json.loads(await f.read())
+
+            self._cache = cache['entries'] if cache.get('version') == CACHE_VERSION else dict()
+        except Exception:
+            logger.warning(f'Could not load the HTTP cache from: {self._cache_path}, starting with an empty cache.')
+            self._cache = dict()
+
+        self._cache_dirty = False
+
+    async def save_cache(self, *, force: bool=False) -> None:
+        """Writes the conditional GET cache to disk, if it has changed since it was last written.
+
+        Args:
+            force (bool): Write even if the cache was written less than `CACHE_SAVE_INTERVAL` seconds ago.
+        """
+        async with self._save_lock:
+            if not self._cache_dirty or (not force and time.monotonic() - self._cache_saved < CACHE_SAVE_INTERVAL):
+                return
+
+            # Changes made while writing mark the cache dirty again
+            data = json.dumps({'version': CACHE_VERSION, 'entries': self._cache})
+            self._cache_dirty = False
+            self._cache_saved = time.monotonic()
+            try:
+                await self._cache_path.parent.mkdir(exist_ok=True)
+                tmp_path = self._cache_path.with_suffix('.tmp')
+                async with aiofiles.open(tmp_path, 'w') as f:
+                    await f.write(data)
+
+                await aiofiles.os.replace(tmp_path, self._cache_path)
+            except Exception:
+                self._cache_dirty = True
+                raise
+
+    async def close(self) -> None:
+        """Writes the cache, closes the shared client session along with all pooled connections, and shuts down the parse executor."""
+        try:
+            await self.save_cache(force=True)
+        except Exception as e:
+            logger.error(f'Failed to write the HTTP cache to: {self._cache_path} with error: {e!r}')
+
+        if self._api_session is not None and not self._api_session.closed:
+            await self._api_session.close()
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+        self._session = None
+        self._api_session = None
+        self.executor = None
+
+http = HTTPClient()
@@ -0,0 +1,67 @@
+# imports
+from typing import Optional
+
+import aiosqlite
+import os
+
+# Runs polling & delivery in one process
+STANDALONE = 'standalone'
+# Polls Apple once for the whole cluster and queues deliveries in the shared outbox, without connecting to the gateway
+POLLER = 'poller'
+# Connects a range of shards and delivers queued announcements to their guilds
+WORKER = 'worker'
+ROLES = (STANDALONE, POLLER, WORKER)
+
+# Set with AR_CLUSTER_ROLE, workers also need AR_SHARD_COUNT & AR_SHARD_IDS (e.g. '0-3' or '0,2,4')
+ROLE = os.environ.get('AR_CLUSTER_ROLE', STANDALONE)
+
+# Seconds workers wait between checks of the outbox for new deliveries
+WAKE_INTERVAL = 1
+# Seconds between workers' checks for failed deliveries whose retry delay has passed
+RETRY_INTERVAL = 30
+
+def parse_shards(spec: str) -> list[int]:
+    """Parses a shard range such as '0-3,8' into shard IDs.
+
+    Args:
+        spec (str): Comma separated shard IDs & inclusive ranges.
+    Returns:
+        Sorted list of shard IDs.
+    """
+    shards = set()
+    for part in spec.split(','):
+        start, _, end = part.strip().partition('-')
+        shards.update(range(int(start), int(end or start) + 1))
+
+    return sorted(shards)
+
+def shard_for(guild: int, shard_count: int) -> int: return (guild >> 22) % shard_count
+
+def load_shards() -> tuple[Optional[list[int]], Optional[int]]:
+    """Reads the shards this process owns.
+
+    Returns:
+        Shard IDs & total shard count for workers, (None, None) otherwise.
+    Raises:
+        ValueError: The cluster role or shard configuration is invalid.
+    """
+    if ROLE not in ROLES:
+        raise ValueError(f"Invalid cluster role: {ROLE}, must be one of: {', '.join(ROLES)}")
+
+    if ROLE != WORKER:
+        return None, None
+
+    if 'AR_SHARD_COUNT' not in os.environ.keys() or 'AR_SHARD_IDS' not in os.environ.keys():
+        raise ValueError("Workers need the 'AR_SHARD_COUNT' and 'AR_SHARD_IDS' environment variables")
+
+    count = int(os.environ['AR_SHARD_COUNT'])
+    ids = parse_shards(os.environ['AR_SHARD_IDS'])
+    if ids[0] < 0 or ids[-1] >= count:
+        raise ValueError(f'Shard IDs must be between 0 and {count - 1}')
+
+    return ids, count
+
+async def data_version(db: aiosqlite.Connection) -> int:
+    """Returns SQLite's data version, which changes whenever another connection commits to the database."""
+    async with db.execute('PRAGMA data_version') as cursor:
+        return (await cursor.fetchone())[0]
@@ -0,0 +1,523 @@
+# imports
+from . import api, metrics
+from .logger import logger
+from typing import Iterable, Optional
+
+import aiosqlite
+import asyncio
+import json
+import time
+
+# Current schema version, stored in SQLite's user_version
+SCHEMA_VERSION = 2
+
+# Seconds buffered writes are held for before being flushed
+FLUSH_DELAY = 5
+
+# Applied on every connection: WAL lets slash command reads run alongside writes, NORMAL sync is durable under WAL
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000'
+)
+
+async def setup_db(db: aiosqlite.Connection) -> None:
+    """Creates all tables & indexes the bot needs.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+    """
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions(
+        guild INTEGER NOT NULL,
+        os TEXT NOT NULL,
+        role INTEGER,
+        channel INTEGER,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY(guild, os)
+        )
+        ''')
+
+    await db.execute('CREATE INDEX IF NOT EXISTS subscriptions_os ON subscriptions(os, enabled, channel, guild, role)')
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS seen_releases(
+        type TEXT NOT NULL,
+        version TEXT NOT NULL,
+        build TEXT NOT NULL,
+        source TEXT NOT NULL,
+        PRIMARY KEY(type, version, build, source)
+        ) WITHOUT ROWID
+        ''')
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS webhooks(
+        channel INTEGER PRIMARY KEY,
+        guild INTEGER NOT NULL,
+        id INTEGER NOT NULL,
+        token TEXT NOT NULL
+        )
+        ''')
+
+    # Rendered announcements waiting on deliveries, keyed by release fingerprint
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS outbox_releases(
+        release TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        created REAL NOT NULL
+        )
+        ''')
+
+    # One row per (release, guild, channel) announcement
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS outbox(
+        release TEXT NOT NULL,
+        guild INTEGER NOT NULL,
+        channel INTEGER NOT NULL,
+        role INTEGER,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        nonce TEXT,
+        created REAL NOT NULL,
+        updated REAL NOT NULL,
+        PRIMARY KEY(release, guild, channel)
+        ) WITHOUT ROWID
+        ''')
+
+    await db.execute('CREATE INDEX IF NOT EXISTS outbox_status ON outbox(status, created)')
+
+    # Every announced release in detection order, the cursor is what stream consumers resume from
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS release_log(
+        cursor INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        data TEXT NOT NULL,
+        detected REAL NOT NULL
+        )
+        ''')
+
+    await db.commit()
+    await migrate_roles(db)
+
+    async with db.execute('PRAGMA user_version') as cursor:
+        version = (await cursor.fetchone())[0]
+
+    if version < 2:
+        # Catalog assets are now indexed per build, record them again rather than announcing all of them.
+        # RSS entries also have the 'Other' type, they're kept so they aren't announced again.
+        catalogs = [_.name for _ in api.sources if _.parser == 'plist']
+        await db.execute(f"DELETE FROM seen_releases WHERE type = 'Other' AND source IN ({','.join('?' * len(catalogs))})", catalogs)
+
+    if version < SCHEMA_VERSION:
+        await db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        await db.commit()
+
+async def migrate_roles(db: aiosqlite.Connection) -> None:
+    """Moves per-guild JSON blobs from the legacy `roles` table into `subscriptions`, then drops it.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+    """
+    async with db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'roles'") as cursor:
+        if await cursor.fetchone() is None:
+            return
+
+    async with db.execute('SELECT guild, data FROM roles') as cursor:
+        rows = await cursor.fetchall()
+
+    subscriptions = list()
+    for guild, data in rows:
+        for os, config in json.loads(data).items():
+            subscriptions.append((guild, os, config.get('role'), config.get('channel'), config.get('enabled', True)))
+
+    await db.executemany('INSERT OR REPLACE INTO subscriptions(guild, os, role, channel, enabled) VALUES(?,?,?,?,?)', subscriptions)
+    await db.execute('DROP TABLE roles')
+    await db.commit()
+
+    logger.info(f'Migrated {len(rows)} guild(s) to the subscriptions table.')
+
+@metrics.DB_SECONDS.timed(query='get_guild_config')
+async def get_guild_config(db: aiosqlite.Connection, guild: int) -> dict[str, dict]:
+    """Fetches a guild's configuration.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        guild (int): Guild ID.
+    Returns:
+        Dictionary of release types to their role, channel & whether they're enabled.
+    """
+    async with db.execute('SELECT os, role, channel, enabled FROM subscriptions WHERE guild = ? ORDER BY rowid', (guild,)) as cursor:
+        return {
+            os: {
+                'role': role,
+                'channel': channel,
+                'enabled': bool(enabled)
+            }
+            for os, role, channel, enabled in await cursor.fetchall()
+        }
+
+@metrics.DB_SECONDS.timed(query='set_guild_config')
+async def set_guild_config(db: aiosqlite.Connection, guild: int, config: dict[str, dict]) -> None:
+    """Creates or replaces a guild's configuration.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        guild (int): Guild ID.
+        config (dict): Dictionary of release types to their role, channel & whether they're enabled.
+    """
+    await db.executemany(
+        'INSERT INTO subscriptions(guild, os, role, channel, enabled) VALUES(?,?,?,?,?) ON CONFLICT(guild, os) DO UPDATE SET role = excluded.role, channel = excluded.channel, enabled = excluded.enabled',
+        ((guild, os, _.get('role'), _.get('channel'), _.get('enabled')) for os, _ in config.items())
+    )
+    await db.commit()
+
+@metrics.DB_SECONDS.timed(query='disable_release')
+async def disable_release(db: aiosqlite.Connection, guild: int, os: str) -> None:
+    """Disables announcements of a release type for a guild.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        guild (int): Guild ID.
+        os (str): Release type.
+    """
+    await db.execute('UPDATE subscriptions SET enabled = 0 WHERE guild = ? AND os = ?', (guild, os))
+    await db.commit()
+
+@metrics.DB_SECONDS.timed(query='remove_guild')
+async def remove_guild(db: aiosqlite.Connection, guild: int) -> None:
+    """Removes a guild's configuration.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        guild (int): Guild ID.
+    """
+    await db.execute('DELETE FROM subscriptions WHERE guild = ?', (guild,))
+    await db.execute('DELETE FROM webhooks WHERE guild = ?', (guild,))
+    await db.commit()
+
+@metrics.DB_SECONDS.timed(query='get_subscribers')
+async def get_subscribers(db: aiosqlite.Connection, os: str) -> list[tuple[int, int, int]]:
+    """Fetches every guild that announces a release type.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        os (str): Release type.
+    Returns:
+        List of (guild, channel, role) rows.
+    """
+    async with db.execute('SELECT guild, channel, role FROM subscriptions WHERE os = ? AND enabled = 1 AND channel IS NOT NULL', (os,)) as cursor:
+        return await cursor.fetchall()
+
+@metrics.DB_SECONDS.timed(query='set_webhook')
+async def set_webhook(db: aiosqlite.Connection, guild: int, channel: int, id: int, token: str) -> None:
+    """Stores the webhook used to announce releases in a channel.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        guild (int): Guild ID.
+        channel (int): Channel ID.
+        id (int): Webhook ID.
+        token (str): Webhook token.
+    """
+    await db.execute('INSERT OR REPLACE INTO webhooks(channel, guild, id, token) VALUES(?,?,?,?)', (channel, guild, id, token))
+    await db.commit()
+
+@metrics.DB_SECONDS.timed(query='remove_webhook')
+async def remove_webhook(db: aiosqlite.Connection, channel: int) -> None:
+    """Forgets a channel's webhook.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        channel (int): Channel ID.
+    """
+    await db.execute('DELETE FROM webhooks WHERE channel = ?', (channel,))
+    await db.commit()
+
+class WriteBuffer():
+    def __init__(self, db: aiosqlite.Connection, delay: float=FLUSH_DELAY):
+        self.db = db
+        self.delay = delay
+        # (guild, release type) pairs to disable
+        self._disabled: set[tuple[int, str]] = set()
+        # Guilds to remove
+        self._removed: set[int] = set()
+        # Pending flush, only set while it's still sleeping so it's never cancelled mid-write
+        self._timer: Optional[asyncio.Task] = None
+        # Keeps a flush from starting while another is writing
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int: return len(self._disabled) + len(self._removed)
+
+    def disable(self, guild: int, os: str) -> None:
+        """Queues disabling announcements of a release type for a guild.
+        
+        Args:
+            guild (int): Guild ID.
+            os (str): Release type.
+        """
+        self._disabled.add((guild, os))
+        self._schedule()
+
+    def remove(self, guild: int) -> None:
+        """Queues removing a guild's configuration.
+        
+        Args:
+            guild (int): Guild ID.
+        """
+        self._removed.add(guild)
+        self._schedule()
+
+    def discard(self, guild: int) -> None:
+        """Drops all queued writes for a guild, used when its configuration is written directly.
+        
+        Args:
+            guild (int): Guild ID.
+        """
+        self._disabled = {_ for _ in self._disabled if _[0] != guild}
+        self._removed.discard(guild)
+
+    def _schedule(self) -> None:
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.delay)
+        self._timer = None
+        await self.flush()
+
+    @metrics.DB_SECONDS.timed(query='flush_buffered')
+    async def flush(self) -> None:
+        """Writes all queued writes in a single transaction."""
+        if self._timer is not None: # Still sleeping, this flush writes its queue
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            if len(self) == 0:
+                return
+
+            disabled, self._disabled = self._disabled, set()
+            removed, self._removed = self._removed, set()
+
+            await self.db.executemany('UPDATE subscriptions SET enabled = 0 WHERE guild = ? AND os = ?', disabled)
+            await self.db.executemany('DELETE FROM subscriptions WHERE guild = ?', ((_,) for _ in removed))
+            await self.db.executemany('DELETE FROM webhooks WHERE guild = ?', ((_,) for _ in removed))
+            await self.db.commit()
+
+class GuildConfigCache():
+    def __init__(self, db: aiosqlite.Connection):
+        self.db = db
+        # Disables & removals made during fan-out, written in batches
+        self.buffer = WriteBuffer(db)
+        # Guild ID -> release type -> role, channel & whether it's enabled
+        self._configs: dict[int, dict[str, dict]] = dict()
+        # Channel ID -> guild, webhook ID & token
+        self._webhooks: dict[int, tuple[int, int, str]] = dict()
+        # Lookups served from memory
+        self.hits: int = 0
+        # Lookups that had to query the database
+        self.misses: int = 0
+
+    @property
+    def hit_rate(self) -> float: return self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0
+
+    @metrics.DB_SECONDS.timed(query='load_guild_configs')
+    async def load(self) -> None:
+        """Loads every guild's configuration in one query."""
+        configs = dict()
+        async with self.db.execute('SELECT guild, os, role, channel, enabled FROM subscriptions ORDER BY rowid') as cursor:
+            async for guild, os, role, channel, enabled in cursor:
+                configs.setdefault(guild, dict())[os] = {
+                    'role': role,
+                    'channel': channel,
+                    'enabled': bool(enabled)
+                }
+
+        self._configs = configs
+
+        async with self.db.execute('SELECT channel, guild, id, token FROM webhooks') as cursor:
+            self._webhooks = {channel: (guild, id, token) for channel, guild, id, token in await cursor.fetchall()}
+
+    async def get(self, guild: int) -> dict[str, dict]:
+        """Fetches a copy of a guild's configuration, safe to modify before passing to `set`.
+        
+        Args:
+            guild (int): Guild ID.
+        Returns:
+            Dictionary of release types to their role, channel & whether they're enabled.
+        """
+        if guild in self._configs:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._configs[guild] = await get_guild_config(self.db, guild)
+
+        return {os: dict(_) for os, _ in self._configs[guild].items()}
+
+    async def set(self, guild: int, config: dict[str, dict]) -> None:
+        """Creates or replaces a guild's configuration.
+        
+        Args:
+            guild (int): Guild ID.
+            config (dict): Dictionary of release types to their role, channel & whether they're enabled.
+        """
+        self.buffer.discard(guild)
+        await set_guild_config(self.db, guild, config)
+        self._configs[guild] = {os: dict(_) for os, _ in config.items()}
+
+    async def disable(self, guild: int, os: str, *, buffered: bool=False) -> None:
+        """Disables announcements of a release type for a guild.
+        
+        Args:
+            guild (int): Guild ID.
+            os (str): Release type.
+            buffered (bool): Queue the database write until the next flush instead of writing it immediately.
+        """
+        if buffered:
+            self.buffer.disable(guild, os)
+        else:
+            await disable_release(self.db, guild, os)
+
+        if os in self._configs.get(guild, dict()):
+            self._configs[guild][os]['enabled'] = False
+
+    async def remove(self, guild: int, *, buffered: bool=False) -> None:
+        """Removes a guild's configuration.
+        
+        Args:
+            guild (int): Guild ID.
+            buffered (bool): Queue the database write until the next flush instead of writing it immediately.
+        """
+        if buffered:
+            self.buffer.remove(guild)
+        else:
+            self.buffer.discard(guild)
+            await remove_guild(self.db, guild)
+
+        self._configs.pop(guild, None)
+        self._webhooks = {channel: _ for channel, _ in self._webhooks.items() if _[0] != guild}
+
+    def webhook(self, channel: int) -> Optional[tuple[int, str]]:
+        """Looks up the webhook used to announce releases in a channel.
+        
+        Args:
+            channel (int): Channel ID.
+        Returns:
+            Webhook ID & token, if one is stored.
+        """
+        webhook = self._webhooks.get(channel)
+        return webhook[1:] if webhook is not None else None
+
+    async def set_webhook(self, guild: int, channel: int, id: int, token: str) -> None:
+        """Stores the webhook used to announce releases in a channel.
+        
+        Args:
+            guild (int): Guild ID.
+            channel (int): Channel ID.
+            id (int): Webhook ID.
+            token (str): Webhook token.
+        """
+        await set_webhook(self.db, guild, channel, id, token)
+        self._webhooks[channel] = (guild, id, token)
+
+    async def remove_webhook(self, channel: int) -> None:
+        """Forgets a channel's webhook.
+        
+        Args:
+            channel (int): Channel ID.
+        """
+        if self._webhooks.pop(channel, None) is not None:
+            await remove_webhook(self.db, channel)
+
+    async def flush(self) -> None:
+        """Writes all buffered disables & removals."""
+        await self.buffer.flush()
+
+    def subscribers(self, os: str) -> list[tuple[int, int, int]]:
+        """Lists every guild that announces a release type.
+        
+        Args:
+            os (str): Release type.
+        Returns:
+            List of (guild, channel, role) tuples.
+        """
+        self.hits += 1
+        return [
+            (guild, config[os]['channel'], config[os]['role'])
+            for guild, config in self._configs.items()
+            if os in config and config[os]['enabled'] and config[os]['channel'] is not None
+        ]
+
+@metrics.DB_SECONDS.timed(query='load_seen')
+async def load_seen(db: aiosqlite.Connection) -> set[tuple[str, str, Optional[str], str]]:
+    """Loads the fingerprints of every release that has already been seen.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+    Returns:
+        Set of release fingerprints.
+    """
+    async with db.execute('SELECT type, version, build, source FROM seen_releases') as cursor:
+        return {(type, version, build or None, source) for type, version, build, source in await cursor.fetchall()}
+
+@metrics.DB_SECONDS.timed(query='mark_seen')
+async def mark_seen(db: aiosqlite.Connection, releases: Iterable, *, commit: bool=True) -> None:
+    """Records releases as seen.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        releases (Iterable): Releases to record.
+        commit (bool): Commit immediately, pass False to write as part of a larger transaction.
+    """
+    await db.executemany(
+        'INSERT OR IGNORE INTO seen_releases(type, version, build, source) VALUES(?,?,?,?)',
+        ((type, version, build or '', source) for type, version, build, source in (_.fingerprint for _ in releases))
+    )
+    if commit:
+        await db.commit()
+
+@metrics.DB_SECONDS.timed(query='log_releases')
+async def log_releases(db: aiosqlite.Connection, releases: Iterable, *, commit: bool=True) -> None:
+    """Appends newly detected releases to the release log.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        releases (Iterable): Releases to record.
+        commit (bool): Commit immediately, pass False to write as part of a larger transaction.
+    """
+    now = time.time()
+    await db.executemany(
+        'INSERT INTO release_log(kind, data, detected) VALUES(?,?,?)',
+        ((type(_).__name__, json.dumps(_.to_dict()), now) for _ in releases)
+    )
+    if commit:
+        await db.commit()
+
+@metrics.DB_SECONDS.timed(query='get_log')
+async def get_log(db: aiosqlite.Connection, after: int, limit: int) -> list[tuple[int, str, str, float]]:
+    """Fetches releases logged after a cursor.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        after (int): Cursor to start after.
+        limit (int): Maximum number of entries.
+    Returns:
+        List of (cursor, kind, data, detected) rows, oldest first.
+    """
+    async with db.execute('SELECT cursor, kind, data, detected FROM release_log WHERE cursor > ? ORDER BY cursor LIMIT ?', (after, limit)) as cursor:
+        return await cursor.fetchall()
+
+@metrics.DB_SECONDS.timed(query='get_log_cursor')
+async def get_log_cursor(db: aiosqlite.Connection) -> int:
+    """Returns the cursor of the most recently logged release, 0 if none have been logged.
+    
+    Args:
+        db (aiosqlite.Connection): Database connection.
+    """
+    async with db.execute('SELECT COALESCE(MAX(cursor), 0) FROM release_log') as cursor:
+        return (await cursor.fetchone())[0]
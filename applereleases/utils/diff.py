@@ -0,0 +1,54 @@
+# imports
+from typing import Hashable, Iterable, Protocol
+
+class Fingerprinted(Protocol):
+    # Stable identity: (type, version, build, source)
+    fingerprint: tuple[Hashable, ...]
+    # Hash of everything else, used to detect changed entries
+    digest: int
+
+class ReleaseDiff():
+    def __init__(self, added: list, removed: list, changed: list):
+        # Releases only in the new list
+        self.added: list = added
+        # Releases only in the old list
+        self.removed: list = removed
+        # Releases in both lists whose contents differ, taken from the new list
+        self.changed: list = changed
+
+    def __bool__(self) -> bool: return bool(self.added or self.removed or self.changed)
+
+def index_releases(releases: Iterable[Fingerprinted]) -> dict[tuple, Fingerprinted]:
+    """Indexes releases by their fingerprint.
+
+    Args:
+        releases (Iterable): Releases to index.
+    Returns:
+        Dictionary of fingerprints to releases, the last release wins if a fingerprint repeats.
+    """
+    return {release.fingerprint: release for release in releases}
+
+def diff_releases(old: Iterable[Fingerprinted], new: Iterable[Fingerprinted]) -> ReleaseDiff:
+    """Compares two release lists in linear time.
+
+    Args:
+        old (Iterable): Previously known releases.
+        new (Iterable): Freshly fetched releases.
+    Returns:
+        Releases added, removed and changed between the two lists.
+    """
+    old_index = old if isinstance(old, dict) else index_releases(old)
+    new_index = new if isinstance(new, dict) else index_releases(new)
+
+    added = list()
+    changed = list()
+    for fingerprint, release in new_index.items():
+        previous = old_index.get(fingerprint)
+        if previous is None:
+            added.append(release)
+        elif previous.digest != release.digest:
+            changed.append(release)
+
+    removed = [release for fingerprint, release in old_index.items() if fingerprint not in new_index]
+
+    return ReleaseDiff(added, removed, changed)
@@ -0,0 +1,177 @@
+# imports
+from .logger import logger
+from typing import Awaitable, Callable, Hashable, Iterable, Optional
+
+import asyncio
+import discord
+import time
+
+# Messages sent per second across all routes, kept below Discord's global limit of 50 to leave room for interactions
+GLOBAL_RATE = 40
+# Messages that may be sent in a burst across all routes
+GLOBAL_BURST = 40
+# Messages sent per second to a single channel, Discord allows 5 every 5 seconds
+ROUTE_RATE = 1
+# Messages that may be sent in a burst to a single channel
+ROUTE_BURST = 5
+# Number of sends in flight at once
+CONCURRENCY = 50
+# Attempts made per message before giving up on it
+MAX_ATTEMPTS = 3
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5
+# py-cord sleeps through 429s & retries them itself, so they rarely reach a fan-out. A send taking this many
+# seconds most likely waited out a rate limit, and slows the buckets down the same way a 429 would
+SLOW_SEND = 2
+
+class TokenBucket():
+    def __init__(self, rate: float, capacity: int):
+        # Tokens added per second
+        self.rate: float = rate
+        self.max_rate: float = rate
+        # Maximum tokens held at once
+        self.capacity: int = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+        # Time until which no tokens are handed out, set after a 429
+        self.blocked_until: float = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits until a token is available, then takes it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, retry_after: float) -> None:
+        """Blocks the bucket for `retry_after` seconds and halves its rate.
+        
+        Args:
+            retry_after (float): Seconds Discord asked to wait for, 0 to only slow down.
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        self.rate = max(self.max_rate / 8, self.rate / 2)
+        self.tokens = 0
+
+    def reward(self) -> None:
+        """Slowly restores the bucket's rate after a successful request."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate * 1.05)
+
+class FanOutResult():
+    def __init__(self, total: int):
+        # Messages queued
+        self.total: int = total
+        # Messages sent
+        self.sent: int = 0
+        # Messages that couldn't be sent
+        self.failed: int = 0
+        # Sends that hit a rate limit, either waited out by py-cord or surfaced as a 429
+        self.rate_limited: int = 0
+        # Seconds the fan-out took
+        self.elapsed: float = 0
+
+    @property
+    def throughput(self) -> float: return self.sent / self.elapsed if self.elapsed > 0 else 0
+
+class FanOut():
+    def __init__(self, *, rate: float=GLOBAL_RATE, burst: int=GLOBAL_BURST, concurrency: int=CONCURRENCY):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        # Result of the most recent fan-out
+        self.last_result: Optional[FanOutResult] = None
+
+    async def run(self, jobs: Iterable[tuple[Hashable, Callable[[], Awaitable]]], name: str='Fan-out') -> FanOutResult:
+        """Runs send jobs concurrently under the global and per-route rate limits.
+
+        Jobs that take longer than `SLOW_SEND` slow their route & the global rate down, jobs that still fail with
+        a 429 once py-cord gives up are retried after the requested delay, any other exception is logged.
+        A job returning False is counted as failed without being retried.
+
+        Args:
+            jobs (Iterable): Pairs of route keys (e.g. a channel ID) and coroutine functions sending a message.
+            name (str): Name used when reporting progress.
+        Returns:
+            Counts of sent and failed messages, along with how long the fan-out took.
+        """
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        result = FanOutResult(queue.qsize())
+        routes: dict[Hashable, TokenBucket] = dict()
+        start = last_report = time.monotonic()
+
+        async def worker() -> None:
+            nonlocal last_report
+
+            while not queue.empty():
+                route, job = queue.get_nowait()
+                if route not in routes:
+                    routes[route] = TokenBucket(ROUTE_RATE, ROUTE_BURST)
+
+                await self.deliver(job, routes[route], result)
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    logger.info(f'{name} progress: {result.sent + result.failed}/{result.total} messages after {now - start:.1f}s.')
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, result.total))))
+
+        result.elapsed = time.monotonic() - start
+        self.last_result = result
+        logger.info(f'{name} finished: sent {result.sent}/{result.total} messages in {result.elapsed:.1f}s ({result.throughput:.1f} msg/s, {result.failed} failed, {result.rate_limited} rate limited).')
+        return result
+
+    async def deliver(self, job: Callable[[], Awaitable], route: TokenBucket, result: FanOutResult) -> None:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.bucket.acquire()
+            await route.acquire()
+
+            start = time.monotonic()
+            try:
+                delivered = await job()
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == MAX_ATTEMPTS:
+                    logger.error(f'Failed to send message after {attempt} attempt(s) with error: {e}')
+                    break
+
+                result.rate_limited += 1
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                if e.response.headers.get('X-RateLimit-Global') == 'true':
+                    self.bucket.penalize(retry_after)
+                else:
+                    route.penalize(retry_after)
+
+                continue
+            except Exception as e:
+                logger.error(f'Failed to send message with error: {e}')
+                break
+
+            if time.monotonic() - start >= SLOW_SEND: # Rate limited within py-cord, back off without blocking as it already waited
+                result.rate_limited += 1
+                self.bucket.penalize(0)
+                route.penalize(0)
+            else:
+                self.bucket.reward()
+                route.reward()
+
+            if delivered is False:
+                break
+
+            result.sent += 1
+            return
+
+        result.failed += 1
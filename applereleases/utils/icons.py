@@ -0,0 +1,141 @@
+# imports
+from . import metrics
+from .client import http
+from .logger import logger
+from aiopath import AsyncPath
+from collections import OrderedDict
+from lxml import etree
+from typing import Iterable, Optional
+
+import aiofiles
+import aiofiles.os
+import asyncio
+import json
+import time
+
+# Icons are persisted here between restarts
+ICON_CACHE_PATH = 'Data/icon_cache.json'
+# Maximum number of icons cached
+MAX_ICONS = 512
+# Seconds an icon is cached for
+ICON_TTL = 7 * 24 * 60 * 60
+# Used when a page has no og:image
+DEFAULT_ICON = 'https://www.apple.com/ac/structured-data/images/open_graph_logo.png'
+
+class IconCache():
+    def __init__(self, path: str=ICON_CACHE_PATH, size: int=MAX_ICONS, ttl: float=ICON_TTL):
+        self.path = AsyncPath(path)
+        self.size = size
+        self.ttl = ttl
+        # Link -> (icon URL, UNIX time it was fetched at), least recently used first
+        self._icons: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._dirty = False
+        # Lookups served from the cache
+        self.hits: int = 0
+        # Lookups that had to fetch the page
+        self.misses: int = 0
+
+    def get(self, link: str) -> Optional[str]:
+        """Returns a cached icon, or None if it isn't cached or has expired."""
+        cached = self._icons.get(link)
+        if cached is None or time.time() - cached[1] > self.ttl:
+            return
+
+        self._icons.move_to_end(link)
+        return cached[0]
+
+    def put(self, link: str, icon: str) -> None:
+        """Caches an icon, evicting the least recently used one if the cache is full."""
+        self._icons[link] = (icon, time.time())
+        self._icons.move_to_end(link)
+        while len(self._icons) > self.size:
+            self._icons.popitem(last=False)
+
+        self._dirty = True
+
+    async def fetch(self, link: str) -> str:
+        """Gets the icon for a page, from the cache if possible.
+        
+        Args:
+            link (str): Page URL.
+        Returns:
+            Icon URL.
+        """
+        icon = self.get(link)
+        if icon is not None:
+            self.hits += 1
+            metrics.ICON_SECONDS.observe(0, cache='hit')
+            return icon
+
+        self.misses += 1
+        try:
+            with metrics.ICON_SECONDS.time(cache='miss'):
+                icon = await find_og_image(link)
+        except Exception as e:
+            logger.error(f'Failed to fetch the icon for: {link} with error: {e!r}')
+            return DEFAULT_ICON
+
+        if icon is None:
+            icon = DEFAULT_ICON
+
+        self.put(link, icon)
+        return icon
+
+    async def prefetch(self, links: Iterable[str]) -> None:
+        """Fetches the icons for several pages concurrently, then persists the cache.
+        
+        Args:
+            links (Iterable): Page URLs.
+        """
+        await asyncio.gather(*(self.fetch(link) for link in set(links)))
+        await self.save()
+
+    async def load(self) -> None:
+        """Loads cached icons from disk."""
+        if not await self.path.is_file():
+            return
+
+        try:
+            async with aiofiles.open(self.path) as f:
+                icons = json.loads(await f.read())
+        except Exception:
+            logger.warning(f'Could not load the icon cache from: {self.path}, starting with an empty cache.')
+            return
+
+        self._icons = OrderedDict((link, tuple(_)) for link, _ in icons.items())
+        self._dirty = False
+
+    async def save(self) -> None:
+        """Writes cached icons to disk, if they've changed since they were last written."""
+        if not self._dirty:
+            return
+
+        await self.path.parent.mkdir(exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        async with aiofiles.open(tmp_path, 'w') as f:
+            await f.write(json.dumps(self._icons))
+
+        await aiofiles.os.replace(tmp_path, self.path)
+        self._dirty = False
+
+async def find_og_image(link: str) -> Optional[str]:
+    """Streams a page, stopping as soon as its og:image is found or its <head> ends.
+    
+    Args:
+        link (str): Page URL.
+    Returns:
+        The og:image URL, or None if the page has none.
+    """
+    parser = etree.HTMLPullParser(events=('start', 'end'))
+    async with http.session.get(link) as resp:
+        async for chunk in resp.content.iter_chunked(8192):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == 'start' and element.tag == 'meta' and element.get('property') == 'og:image':
+                    return element.get('content')
+                elif event == 'end' and element.tag in ('head', 'body'):
+                    return
+
+    return
+
+icons = IconCache()
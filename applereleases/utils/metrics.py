@@ -0,0 +1,232 @@
+# imports
+from .logger import logger
+from aiohttp import web
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import functools
+import math
+import os
+import time
+
+# Port metrics are served on in Prometheus' text format, the server is only started when AR_METRICS_PORT is set.
+# Cluster workers serve on this port plus one plus their first shard ID, so a poller & its workers can share one configuration
+PORT = os.environ.get('AR_METRICS_PORT')
+HOST = os.environ.get('AR_METRICS_HOST', '127.0.0.1')
+
+# Upper bounds of latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Quantiles reported by summaries
+QUANTILES = (0.5, 0.9, 0.99)
+# Observations summaries compute quantiles over
+SUMMARY_WINDOW = 1024
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str='') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return f"{{{','.join(pairs)}}}" if len(pairs) > 0 else ''
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def percentile(observations: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted, non-empty observations."""
+    return observations[min(int(q * len(observations)), len(observations) - 1)]
+
+class Metric():
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]: return tuple(str(labels.get(_, '')) for _ in self.labels)
+
+    def samples(self) -> Iterator[str]: raise NotImplementedError
+
+    def render(self) -> str:
+        return '\n'.join((f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}', *self.samples()))
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]=()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = dict()
+
+    def inc(self, amount: float=1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float: return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float: return sum(self._values.values())
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f'{self.name}_total{format_labels(self.labels, key)} {format_value(value)}'
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]=(), buckets: tuple[float, ...]=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = (*sorted(buckets), math.inf)
+        # Labels -> per-bucket counts (not cumulative), sum & count
+        self._values: dict[tuple[str, ...], list] = dict()
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = [[0] * len(self.buckets), 0, 0]
+
+        counts = self._values[key]
+        counts[0][bisect_left(self.buckets, value)] += 1
+        counts[1] += value
+        counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the block takes, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """Decorates a coroutine function, observing how long each call takes."""
+        def decorator(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return await function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, **labels) -> int:
+        values = self._values.get(self._key(labels))
+        return values[2] if values is not None else 0
+
+    def total_count(self) -> int: return sum(_[2] for _ in self._values.values())
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                le = 'le="' + format_value(bound) + '"'
+                yield f'{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}'
+
+            yield f'{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labels, key)} {count}'
+
+class Summary(Metric):
+    """Reports quantiles over the most recent observations, along with a running sum & count."""
+    type = 'summary'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]=(), quantiles: tuple[float, ...]=QUANTILES, window: int=SUMMARY_WINDOW):
+        super().__init__(name, help, labels)
+        self.quantiles = quantiles
+        self.window = window
+        # Labels -> recent observations, sum & count
+        self._values: dict[tuple[str, ...], list] = dict()
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = [deque(maxlen=self.window), 0, 0]
+
+        values = self._values[key]
+        values[0].append(value)
+        values[1] += value
+        values[2] += 1
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        values = self._values.get(self._key(labels))
+        if values is None or len(values[0]) == 0:
+            return
+
+        return percentile(sorted(values[0]), q)
+
+    def samples(self) -> Iterator[str]:
+        for key, (recent, total, count) in self._values.items():
+            observations = sorted(recent)
+            for q in self.quantiles:
+                value = percentile(observations, q) if len(observations) > 0 else math.nan
+                quantile = 'quantile="' + str(q) + '"'
+                yield f'{self.name}{format_labels(self.labels, key, quantile)} {value!r}'
+
+            yield f'{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labels, key)} {count}'
+
+registry: list[Metric] = list()
+
+def render() -> str:
+    """Renders every metric in Prometheus' text exposition format."""
+    return '\n'.join(_.render() for _ in registry) + '\n'
+
+FETCH_SECONDS = Histogram('applereleases_fetch_seconds', 'Time taken to fetch a source, including retries.', ('source', 'status'))
+PARSE_SECONDS = Histogram('applereleases_parse_seconds', 'Time taken to parse a response, including executor overhead.', ('parser',))
+NOT_MODIFIED = Counter('applereleases_not_modified', 'Fetches skipped because the response was unchanged.')
+COMPARE_SECONDS = Histogram('applereleases_compare_seconds', 'Time taken to diff a poll against the previous one.', ('source',))
+ICON_SECONDS = Histogram('applereleases_icon_seconds', 'Time taken to look up a release icon.', ('cache',))
+DB_SECONDS = Histogram('applereleases_db_query_seconds', 'Time taken by database queries.', ('query',))
+SEND_SECONDS = Histogram('applereleases_send_seconds', 'Time taken to send one announcement message.', ('backend', 'outcome'))
+DELIVERIES = Counter('applereleases_deliveries', 'Release deliveries by outcome.', ('outcome',))
+DELIVERY_LATENCY = Summary('applereleases_detected_to_delivered_seconds', 'Time from a release being detected to it being delivered to a guild.')
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+async def serve(host: str, port: int) -> web.AppRunner:
+    """Serves metrics at /metrics.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+    Returns:
+        The server's runner, clean it up to stop serving.
+    """
+    app = web.Application()
+    app.add_routes([web.get('/metrics', handle_metrics)])
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except Exception:
+        await runner.cleanup()
+        raise
+
+    logger.info(f'Metrics available at http://{host}:{port}/metrics.')
+    return runner
+
+def port_for(shard_ids: Optional[list[int]]) -> int: return int(PORT) + (shard_ids[0] + 1 if shard_ids is not None else 0)
+
+async def start(shard_ids: Optional[list[int]]=None) -> Optional[web.AppRunner]:
+    """Serves metrics on this process' port when AR_METRICS_PORT is set, never raising.
+
+    Args:
+        shard_ids (list): Shards owned by this process, None unless it's a cluster worker.
+    Returns:
+        The server's runner, or None if metrics aren't enabled or the port couldn't be bound.
+    """
+    if PORT is None:
+        return
+
+    try:
+        return await serve(HOST, port_for(shard_ids))
+    except OSError as e:
+        logger.warning(f'Could not serve metrics on {HOST}:{port_for(shard_ids)}, continuing without them: {e}')
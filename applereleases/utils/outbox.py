@@ -0,0 +1,223 @@
+# imports
+from . import db as database, metrics
+from .announce import Announcement
+from .logger import logger
+from typing import Iterable, Optional
+
+import aiosqlite
+import asyncio
+import hashlib
+import json
+import time
+
+# Delivery statuses
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+# Attempts a delivery gets before it's given up on
+MAX_ATTEMPTS = 5
+# Seconds finished deliveries are kept for
+RETENTION = 7 * 24 * 60 * 60
+# Seconds before a failed delivery is retried, doubled for every attempt after the first
+RETRY_DELAY = 30
+# Status updates held in memory before being written
+FLUSH_SIZE = 100
+# Seconds status updates are held for at most. Outcomes are written as soon as the event loop is free, sends finishing
+# together share one commit, so a crash leaves almost no sent message to be resent past Discord's nonce window
+FLUSH_DELAY = 0
+
+class Delivery():
+    """An announcement of one release to one guild's channel."""
+    __slots__ = ('release', 'guild', 'channel', 'role', 'status', 'attempts', 'nonce', 'created')
+
+    def __init__(self, release: str, guild: int, channel: int, role: Optional[int], status: str=PENDING, attempts: int=0, nonce: Optional[str]=None, created: Optional[float]=None):
+        # Release key, see `release_key`
+        self.release = release
+        self.guild = guild
+        self.channel = channel
+        self.role = role
+        self.status = status
+        self.attempts = attempts
+        # Idempotency key of the message this delivery was last attempted in
+        self.nonce = nonce
+        # UNIX time the release was detected & queued at
+        self.created = created
+
+    @property
+    def key(self) -> tuple[str, int, int]: return (self.release, self.guild, self.channel)
+
+def release_key(release) -> str: return json.dumps(release.fingerprint)
+
+def make_nonce(deliveries: Iterable[Delivery]) -> str:
+    """Derives a message nonce from the deliveries it carries, Discord drops a repeated nonce instead of posting the message twice."""
+    key = '\n'.join(sorted(f'{_.release}|{_.guild}|{_.channel}' for _ in deliveries))
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest() # Nonces are limited to 25 characters
+
+def group(deliveries: list[Delivery], size: int) -> list[list[Delivery]]:
+    """Groups deliveries into messages of up to `size` releases per channel.
+
+    Deliveries that were already attempted keep their original grouping, so a retry reuses the same nonce.
+    """
+    attempted: dict[str, list[Delivery]] = dict()
+    fresh: dict[tuple[int, int], list[Delivery]] = dict()
+    for delivery in deliveries:
+        if delivery.nonce is not None:
+            attempted.setdefault(delivery.nonce, list()).append(delivery)
+        else:
+            fresh.setdefault((delivery.guild, delivery.channel), list()).append(delivery)
+
+    groups = list(attempted.values())
+    for channel in fresh.values():
+        groups.extend(channel[i:i + size] for i in range(0, len(channel), size))
+
+    return groups
+
+class Outbox():
+    """Durable queue of announcement deliveries, backed by the `outbox` table.
+
+    Deliveries are written in the same transaction that marks their releases as seen, so a release is
+    either fully queued or will be detected again. Rows left `sending` by a crash are retried with the
+    same nonce when the outbox is next drained.
+
+    In cluster mode every process shares the outbox, each worker only drains the guilds on its own shards.
+    """
+    def __init__(self, db: aiosqlite.Connection, shard_ids: Optional[list[int]]=None, shard_count: Optional[int]=None):
+        self.db = db
+        # Limits draining to guilds on these shards, every guild if None
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        if shard_ids is not None:
+            self._scope = f" AND (guild >> 22) % ? IN ({','.join('?' * len(shard_ids))})"
+            self._scope_params = (shard_count, *shard_ids)
+        else:
+            self._scope = ''
+            self._scope_params = ()
+        # (status, updated, release, guild, channel) updates waiting to be written
+        self._updates: list[tuple[str, float, str, int, int]] = list()
+        # Pending write of recorded outcomes, only set while it's still sleeping so it's never cancelled mid-write
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        # Whether there may be deliveries left to drain
+        self.backlog: bool = True
+
+    @metrics.DB_SECONDS.timed(query='outbox_enqueue')
+    async def enqueue(self, announcements: list[Announcement], subscribers: dict[str, list[tuple[int, int, int]]], detected: Optional[float]=None) -> int:
+        """Queues a delivery for every subscriber of each announcement, marks the releases as seen and logs them.
+
+        Args:
+            announcements (list): Rendered announcements.
+            subscribers (dict): Release types to their (guild, channel, role) subscribers.
+            detected (float): UNIX time the releases were detected at, defaults to now.
+        Returns:
+            Number of deliveries queued.
+        """
+        now = time.time()
+        detected = detected or now
+        releases = list()
+        deliveries = list()
+        for announcement in announcements:
+            key = release_key(announcement.release)
+            releases.append((key, json.dumps(announcement.to_dict()), now))
+            deliveries.extend((key, guild, channel, role, detected, now) for guild, channel, role in subscribers.get(announcement.release.type, ()))
+
+        await self.db.executemany('INSERT OR IGNORE INTO outbox_releases(release, data, created) VALUES(?,?,?)', releases)
+        await self.db.executemany('INSERT OR IGNORE INTO outbox(release, guild, channel, role, created, updated) VALUES(?,?,?,?,?,?)', deliveries)
+        await database.mark_seen(self.db, (_.release for _ in announcements), commit=False)
+        await database.log_releases(self.db, (_.release for _ in announcements), commit=False)
+        await self.db.commit()
+
+        self.backlog = True
+        return len(deliveries)
+
+    @metrics.DB_SECONDS.timed(query='outbox_pending')
+    async def pending(self) -> list[Delivery]:
+        """Fetches every delivery that's due, oldest first.
+
+        Fresh deliveries & those left `sending` by a crash are always due, failed ones only once
+        their retry delay has passed, so an outage doesn't use up every attempt at once.
+        """
+        async with self.db.execute(
+            f'SELECT release, guild, channel, role, status, attempts, nonce, created FROM outbox WHERE (status = ? OR (status = ? AND (attempts = 0 OR updated < ? - ? * (1 << (attempts - 1))))){self._scope} ORDER BY created, release',
+            (SENDING, PENDING, time.time(), RETRY_DELAY, *self._scope_params)
+        ) as cursor:
+            return [Delivery(*_) for _ in await cursor.fetchall()]
+
+    @metrics.DB_SECONDS.timed(query='outbox_announcements')
+    async def announcements(self, releases: Iterable[str]) -> dict[str, Announcement]:
+        """Loads the rendered announcements for a set of release keys."""
+        releases = list(releases)
+        async with self.db.execute(f"SELECT release, data FROM outbox_releases WHERE release IN ({','.join('?' * len(releases))})", releases) as cursor:
+            return {release: Announcement.from_dict(json.loads(data)) for release, data in await cursor.fetchall()}
+
+    @metrics.DB_SECONDS.timed(query='outbox_start')
+    async def start(self, messages: list[tuple[str, list[Delivery]]]) -> None:
+        """Marks deliveries as being sent, before any message goes out.
+
+        Args:
+            messages (list): Pairs of message nonces and the deliveries they carry.
+        """
+        now = time.time()
+        await self.db.executemany(
+            'UPDATE outbox SET status = ?, attempts = attempts + 1, nonce = ?, updated = ? WHERE release = ? AND guild = ? AND channel = ?',
+            ((SENDING, nonce, now, *_.key) for nonce, deliveries in messages for _ in deliveries)
+        )
+        await self.db.commit()
+
+    async def record(self, deliveries: Iterable[Delivery], status: str) -> None:
+        """Records the outcome of deliveries, written right after along with any recorded at the same time.
+
+        Args:
+            deliveries (Iterable): Deliveries sent in one message.
+            status (str): `SENT` or `FAILED`.
+        """
+        now = time.time()
+        self._updates.extend((status, now, *_.key) for _ in deliveries)
+        if len(self._updates) >= FLUSH_SIZE:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(FLUSH_DELAY)
+        self._timer = None
+        await self.flush()
+
+    @metrics.DB_SECONDS.timed(query='outbox_flush')
+    async def flush(self) -> None:
+        """Writes recorded outcomes."""
+        if self._timer is not None: # Still sleeping, this flush writes its updates
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            if len(self._updates) == 0:
+                return
+
+            updates, self._updates = self._updates, list()
+            await self.db.executemany('UPDATE outbox SET status = ?, updated = ? WHERE release = ? AND guild = ? AND channel = ?', updates)
+            await self.db.commit()
+
+    @metrics.DB_SECONDS.timed(query='outbox_finish')
+    async def finish(self) -> None:
+        """Writes recorded outcomes and requeues deliveries that errored, giving up on those out of attempts."""
+        await self.flush()
+
+        await self.db.execute(
+            f'UPDATE outbox SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, updated = ? WHERE status = ?{self._scope}',
+            (MAX_ATTEMPTS, FAILED, PENDING, time.time(), SENDING, *self._scope_params)
+        )
+        await self.db.execute('DELETE FROM outbox WHERE status IN (?, ?) AND updated < ?', (SENT, FAILED, time.time() - RETENTION))
+        await self.db.execute('DELETE FROM outbox_releases WHERE release NOT IN (SELECT release FROM outbox)')
+        await self.db.commit()
+
+        self.backlog = await self.depth() > 0
+        if self.backlog:
+            logger.warning('Some deliveries failed and will be retried once their retry delay has passed.')
+
+    @metrics.DB_SECONDS.timed(query='outbox_depth')
+    async def depth(self) -> int:
+        """Counts deliveries that haven't been sent or given up on."""
+        async with self.db.execute(f'SELECT COUNT(*) FROM outbox WHERE status IN (?, ?){self._scope}', (PENDING, SENDING, *self._scope_params)) as cursor:
+            return (await cursor.fetchone())[0]
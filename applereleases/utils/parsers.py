@@ -0,0 +1,125 @@
+# imports
+from lxml import etree
+from typing import Iterator, Optional, Union
+
+import io
+import plistlib
+
+# Nothing here imports the bot's other modules, so parse executor workers can load it cheaply
+
+# Maximum number of builds indexed per catalog
+MAX_ASSETS = 2000
+# Asset keys holding the firmware version, in order of preference
+FIRMWARE_KEYS = ('OSVersion', 'FirmwareVersion', 'FirmwareVersionMajor')
+# Asset keys identifying the device or accessory model, in order of preference
+MODEL_KEYS = ('SupportedDevices', 'HardwareModel', 'ProductID')
+
+def rss_key(item: dict) -> str:
+    """Returns the watermark key of an RSS entry, its GUID or its link & publish date if it has none."""
+    return item.get('guid') or f"{item.get('link')}|{item.get('pubdate')}"
+
+def iter_rss(body: bytes) -> Iterator[dict]:
+    """Lazily parses an RSS feed, yielding entries as they're read.
+    
+    Args:
+        body (bytes): Raw RSS feed.
+    Yields:
+        RSS entries, in feed order.
+    """
+    for _, item in etree.iterparse(io.BytesIO(body), events=('end',), tag='item', recover=True):
+        yield {
+            'title': item.findtext('title'),
+            'link': item.findtext('link'),
+            'guid': item.findtext('guid'),
+            'description': item.findtext('description'),
+            'pubdate': item.findtext('pubDate')
+        }
+
+        # Free the parsed item, along with any earlier siblings
+        item.clear()
+        while item.getprevious() is not None:
+            del item.getparent()[0]
+
+def parse_rss(body: Union[str, bytes], known: Optional[list[dict]]=None) -> list[dict]:
+    """Parses an RSS feed into a list of entries.
+
+    Entries are newest first, so parsing stops at the first entry that's already known,
+    and the known entries from that point on are reused.
+    
+    Args:
+        body (Union[str, bytes]): Raw RSS feed.
+        known (list): Entries from the previous parse of this feed.
+    Returns:
+        List of RSS entries.
+    """
+    if isinstance(body, str):
+        body = body.encode()
+
+    known = known or list()
+    watermarks = {rss_key(_): i for i, _ in enumerate(known)}
+
+    articles = list()
+    for item in iter_rss(body):
+        index = watermarks.get(rss_key(item))
+        if index is not None:
+            # Keep the feed's length steady as older entries fall off the end
+            articles.extend(known[index:index + max(len(known) - len(articles), 0)])
+            break
+
+        articles.append(item)
+
+    return articles
+
+def asset_field(asset: dict, keys: tuple[str, ...]) -> Optional[str]:
+    """Returns the first of `keys` present in an asset, joining lists into one string."""
+    for key in keys:
+        value = asset.get(key)
+        if value is not None:
+            return ','.join(sorted(str(_) for _ in value)) if isinstance(value, list) else str(value)
+
+    return
+
+def parse_plist(body: bytes, limit: int=MAX_ASSETS) -> dict:
+    """Parses a MobileAsset catalog into an index of its usable assets.
+
+    Assets are grouped by build & firmware version, so delta updates and the same build shipped
+    for several models show up once, carrying every model & supported device.
+    
+    Args:
+        body (bytes): Raw plist.
+        limit (int): Maximum number of builds kept.
+    Returns:
+        Builds' number, firmware version, models, download URL & supported devices in catalog order,
+        along with the number of assets skipped for being past the limit.
+    """
+    plist = plistlib.loads(body)
+
+    assets = dict()
+    skipped = 0
+    for _ in plist.get('Assets', list()):
+        if _.get('Build') is None or _.get('__BaseURL') is None:
+            continue
+
+        key = (_['Build'], asset_field(_, FIRMWARE_KEYS))
+        if key not in assets:
+            if len(assets) >= limit:
+                skipped += 1
+                continue
+
+            assets[key] = {
+                'version': _['Build'],
+                'firmware': key[1],
+                'models': set(),
+                'zip': _['__BaseURL'] + _['__RelativePath'],
+                'devices': set()
+            }
+
+        model = asset_field(_, MODEL_KEYS)
+        if model is not None:
+            assets[key]['models'].add(model)
+        assets[key]['devices'].update(_.get('SupportedDevices', list()))
+
+    return {
+        'assets': [{**_, 'models': sorted(_['models']), 'devices': sorted(_['devices'])} for _ in assets.values()],
+        'skipped': skipped
+    }
@@ -0,0 +1,97 @@
+# imports
+from . import metrics
+from .fanout import FanOutResult
+from .icons import icons
+from .logger import logger
+from collections import deque
+from typing import Optional
+
+import asyncio
+import discord
+import time
+
+# Seconds between samples
+SAMPLE_INTERVAL = 1
+# Samples kept, rates & percentiles are computed over this window
+WINDOW = 300
+# Seconds between outbox depth queries
+DEPTH_INTERVAL = 10
+
+class Sampler():
+    """Samples runtime statistics in the background, so `/stats` only reads the latest snapshot.
+
+    Each sample costs one timer wake-up and a handful of attribute reads, the outbox is only queried every `DEPTH_INTERVAL` seconds.
+    """
+    def __init__(self, bot: discord.Bot, interval: float=SAMPLE_INTERVAL, window: int=WINDOW):
+        self.bot = bot
+        self.interval = interval
+        # Seconds each sample's wake-up was late by
+        self.lag: deque[float] = deque(maxlen=window)
+        # (monotonic time, total DB queries) per sample
+        self._queries: deque[tuple[float, int]] = deque(maxlen=window)
+        # Shard ID -> gateway latency, in seconds
+        self.latencies: dict[int, float] = dict()
+        # Source name -> seconds its last poll took & whether it succeeded
+        self.polls: dict[str, tuple[float, bool]] = dict()
+        # Result of the last fan-out
+        self.fanout: Optional[FanOutResult] = None
+        # Deliveries waiting in the outbox
+        self.outbox_depth: Optional[int] = None
+        # Cache name -> hit rate, None until the cache is used
+        self.hit_rates: dict[str, Optional[float]] = dict()
+        # Database queries per second over the window
+        self.db_rate: float = 0
+        self._last_depth: float = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def lag_percentile(self, q: float) -> Optional[float]: return metrics.percentile(sorted(self.lag), q) if len(self.lag) > 0 else None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag.append(max(loop.time() - start - self.interval, 0))
+
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.error(f'Failed to sample statistics with error: {e!r}')
+
+    async def sample(self) -> None:
+        now = time.monotonic()
+
+        if self.bot.is_ready():
+            self.latencies = {shard: latency for shard, latency in self.bot.latencies}
+
+        events = self.bot.get_cog('Events')
+        if events is not None:
+            self.polls = {
+                source: (state.last_duration, state.last_ok)
+                for source, state in events.scheduler.state.items()
+                if state.last_duration is not None
+            }
+            self.fanout = events.fanout.last_result
+
+        self._queries.append((now, metrics.DB_SECONDS.total_count()))
+        (first, first_count), (last, last_count) = self._queries[0], self._queries[-1]
+        self.db_rate = (last_count - first_count) / (last - first) if last > first else 0
+
+        lookups = metrics.NOT_MODIFIED.total() + metrics.PARSE_SECONDS.total_count()
+        self.hit_rates = {
+            'Guild configs': self.bot.guild_config.hit_rate if self.bot.guild_config.hits + self.bot.guild_config.misses > 0 else None,
+            'Icons': icons.hits / (icons.hits + icons.misses) if icons.hits + icons.misses > 0 else None,
+            'HTTP (304)': metrics.NOT_MODIFIED.total() / lookups if lookups > 0 else None
+        }
+
+        if now - self._last_depth >= DEPTH_INTERVAL:
+            self._last_depth = now
+            self.outbox_depth = await self.bot.outbox.depth()
@@ -0,0 +1,169 @@
+# imports
+from . import api
+from .breaker import CircuitBreaker
+from .logger import logger
+from .sources import Source
+from .types import OtherRelease, Release, SourceStatus
+from datetime import date, datetime, time as dt_time
+from pytz import timezone as tz
+from typing import Awaitable, Callable, Optional, Union
+
+import asyncio
+import json
+import os
+import pathlib
+import random
+import time
+
+# Fraction of a source's interval its polls are randomly shifted by
+JITTER = 0.1
+# Seconds sources stay in burst mode after a change is detected
+CHANGE_BURST = 900
+# Unchanged polls after which a source's interval starts doubling
+QUIET_POLLS = 20
+# Used when the 'AR_SCHEDULE' environment variable isn't set
+DEFAULT_SCHEDULE_PATH = pathlib.Path(__file__).parent.parent / 'schedule.json'
+
+# Returns whether the poll found any new releases
+PollHandler = Callable[[Source, list[Union[Release, OtherRelease]], SourceStatus], Awaitable[bool]]
+
+class ReleaseWindows():
+    def __init__(self, timezone: str='US/Pacific', windows: Optional[list[dict]]=None, event_days: Optional[list[str]]=None):
+        # Timezone windows are given in
+        self.timezone = tz(timezone)
+        # (weekdays, start, end) tuples, Monday is 0
+        self.windows: list[tuple[set[int], dt_time, dt_time]] = [
+            (set(_['days']), dt_time.fromisoformat(_['start']), dt_time.fromisoformat(_['end']))
+            for _ in windows or list()
+        ]
+        # Days that are in burst mode all day
+        self.event_days: set[date] = {date.fromisoformat(_) for _ in event_days or list()}
+
+    def match(self, now: Optional[datetime]=None) -> Optional[str]:
+        """Checks whether a time falls within a release window.
+        
+        Args:
+            now (datetime): Time to check, defaults to the current time.
+        Returns:
+            The reason the time is in a release window, or None if it isn't.
+        """
+        now = (now or datetime.now(self.timezone)).astimezone(self.timezone)
+        if now.date() in self.event_days:
+            return 'event day'
+
+        for days, start, end in self.windows:
+            if now.weekday() in days and start <= now.time() <= end:
+                return f"release window ({start.strftime('%H:%M')}-{end.strftime('%H:%M')} {self.timezone.zone})"
+
+        return
+
+def load_windows(path: Optional[str]=None) -> ReleaseWindows:
+    """Loads release windows.
+    
+    Args:
+        path (str): Path to a JSON file describing release windows, defaults to the 'AR_SCHEDULE' environment variable or the bundled schedule.
+    Returns:
+        Release windows.
+    """
+    with open(path or os.environ.get('AR_SCHEDULE') or DEFAULT_SCHEDULE_PATH) as f:
+        return ReleaseWindows(**json.load(f))
+
+class PollState():
+    def __init__(self, interval: float):
+        # Seconds until the next poll
+        self.interval: float = interval
+        # Why the current interval was chosen
+        self.reason: str = 'normal'
+        # Monotonic time of the next poll
+        self.next_poll: float = 0
+        # Monotonic time a change was last detected
+        self.last_change: Optional[float] = None
+        # Polls in a row that failed
+        self.errors: int = 0
+        # Polls in a row that found nothing new
+        self.quiet: int = 0
+        # Seconds the last poll took to fetch & handle
+        self.last_duration: Optional[float] = None
+        # Whether the last poll succeeded
+        self.last_ok: Optional[bool] = None
+
+class Scheduler():
+    def __init__(self, sources: list[Source], handler: PollHandler, *, windows: Optional[ReleaseWindows]=None, concurrency: int=api.FETCH_CONCURRENCY, jitter: float=JITTER):
+        self.sources = sources
+        self.handler = handler
+        self.windows = windows or ReleaseWindows()
+        self.jitter = jitter
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # Source name -> polling state
+        self.state: dict[str, PollState] = {_.name: PollState(_.interval) for _ in sources}
+        # Source name -> circuit breaker
+        self.breakers: dict[str, CircuitBreaker] = {_.name: CircuitBreaker() for _ in sources}
+
+    async def run(self) -> None:
+        """Polls every source on its own schedule, forever."""
+        await asyncio.gather(*(self.poll(source) for source in self.sources))
+
+    async def poll(self, source: Source) -> None:
+        state = self.state[source.name]
+        breaker = self.breakers[source.name]
+
+        while True:
+            if not breaker.allow(): # Skip the source entirely until the breaker lets a trial poll through
+                state.interval, state.reason = breaker.retry_in(), f'circuit open: {breaker.last_error}'
+                state.next_poll = time.monotonic() + state.interval
+                await asyncio.sleep(state.interval)
+                continue
+
+            start = time.monotonic()
+            releases, status = await api.fetch_source(source, self.semaphore)
+            if status.ok:
+                breaker.record_success()
+            else:
+                was_open = breaker.opened_at is not None
+                breaker.record_failure(status.error)
+                if not was_open and breaker.opened_at is not None:
+                    logger.warning(f'[{source.name}] Circuit opened after {breaker.failures} failed poll(s), skipping it for {breaker.reset_timeout}s.')
+
+            changed = False
+            try:
+                changed = await self.handler(source, releases, status)
+            except Exception as e:
+                logger.error(f'[{source.name}] Failed to handle poll with error: {e!r}')
+
+            state.last_duration, state.last_ok = time.monotonic() - start, status.ok
+            state.errors = 0 if status.ok else state.errors + 1
+            state.quiet = 0 if changed or not status.ok else state.quiet + 1
+            if changed:
+                state.last_change = time.monotonic()
+
+            interval, reason = self.interval(source)
+            if reason != state.reason:
+                logger.info(f'[{source.name}] Polling every {interval:.0f}s: {reason}.')
+
+            state.interval, state.reason = interval, reason
+            state.next_poll = time.monotonic() + interval
+            await asyncio.sleep(interval)
+
+    def interval(self, source: Source) -> tuple[float, str]:
+        """Picks the seconds until a source's next poll, randomly shifted so polls don't line up.
+        
+        Args:
+            source (Source): Source that was just polled.
+        Returns:
+            Seconds to wait, and why that interval was chosen.
+        """
+        state = self.state[source.name]
+
+        if state.errors > 0:
+            interval, reason = source.interval * 2 ** state.errors, f'backing off after {state.errors} failed poll(s)'
+        elif state.last_change is not None and time.monotonic() - state.last_change < CHANGE_BURST:
+            interval, reason = source.burst_interval, 'recent change'
+        elif (window := self.windows.match()) is not None:
+            interval, reason = source.burst_interval, window
+        elif state.quiet >= QUIET_POLLS:
+            interval, reason = source.interval * 2 ** (state.quiet // QUIET_POLLS), f'quiet for {state.quiet} polls'
+        else:
+            interval, reason = source.interval, 'normal'
+
+        interval = min(interval, source.max_interval)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter), reason
@@ -0,0 +1,56 @@
+# imports
+from typing import Optional
+
+import json
+import os
+import pathlib
+
+# Parsers a source may declare
+PARSERS = ('rss', 'plist')
+# Seconds between polls when a source doesn't declare an interval
+DEFAULT_INTERVAL = 120
+# Used when the 'AR_SOURCES' environment variable isn't set
+DEFAULT_PATH = pathlib.Path(__file__).parent.parent / 'sources.json'
+
+class Source():
+    def __init__(self, name: str, url: str, parser: str, img: Optional[str]=None, interval: float=DEFAULT_INTERVAL, burst_interval: Optional[float]=None, max_interval: Optional[float]=None):
+        if parser not in PARSERS:
+            raise ValueError(f"Source '{name}' has an invalid parser: {parser}")
+
+        burst_interval = burst_interval or min(interval, max(interval / 4, 10))
+        max_interval = max_interval or interval * 8
+        if not 0 < burst_interval <= interval <= max_interval:
+            raise ValueError(f"Source '{name}' has invalid intervals, they must satisfy 0 < burst_interval <= interval <= max_interval.")
+
+        # Source name
+        self.name: str = name
+        # Source URL
+        self.url: str = url
+        # Parser used for the source, one of PARSERS
+        self.parser: str = parser
+        # Image shown in announcements
+        self.img: Optional[str] = img
+        # Seconds between polls
+        self.interval: float = interval
+        # Seconds between polls during release windows & right after a change
+        self.burst_interval: float = burst_interval
+        # Longest the interval may grow to when backing off
+        self.max_interval: float = max_interval
+
+def load_sources(path: Optional[str]=None) -> list[Source]:
+    """Loads the source registry.
+    
+    Args:
+        path (str): Path to a JSON file listing sources, defaults to the 'AR_SOURCES' environment variable or the bundled registry.
+    Returns:
+        List of sources.
+    """
+    path = path or os.environ.get('AR_SOURCES') or DEFAULT_PATH
+    with open(path) as f:
+        sources = [Source(**_) for _ in json.load(f)]
+
+    names = [_.name for _ in sources]
+    if len(names) != len(set(names)):
+        raise ValueError(f'Source names in {path} must be unique.')
+
+    return sources
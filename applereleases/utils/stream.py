@@ -0,0 +1,201 @@
+# imports
+from . import db as database
+from .logger import logger
+from aiohttp import web
+from typing import Callable, Optional
+
+import aiosqlite
+import asyncio
+import json
+import os
+
+# Port the release stream is served on, the server is only started when AR_STREAM_PORT is set
+PORT = os.environ.get('AR_STREAM_PORT')
+HOST = os.environ.get('AR_STREAM_HOST', '127.0.0.1')
+# Seconds between keep-alives on idle streams
+HEARTBEAT = 15
+# Maximum number of events returned by a single request or replayed at once
+PAGE_SIZE = 100
+# Events buffered for a consumer before it's disconnected for falling behind, it can resume from its cursor
+QUEUE_SIZE = 256
+
+def format_event(row: tuple[int, str, str, float]) -> dict:
+    cursor, kind, data, detected = row
+    return {
+        'cursor': cursor,
+        'detected': detected,
+        'release': {'kind': kind, **json.loads(data)}
+    }
+
+class ReleaseStream():
+    """Serves the current releases as JSON and pushes new detections over Server-Sent Events & WebSockets.
+
+    Events come from the `release_log` table, so consumers can resume from the last cursor they saw,
+    including across restarts.
+    """
+    def __init__(self, db: aiosqlite.Connection, releases: Callable[[], dict[str, list]]):
+        self.db = db
+        # Returns source names mapped to their releases from the last poll
+        self.releases = releases
+        # Cursor of the newest event pushed to consumers
+        self.cursor: int = 0
+        self._consumers: set[asyncio.Queue] = set()
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get('/releases', self.get_releases),
+            web.get('/events', self.get_events),
+            web.get('/events/stream', self.stream_sse),
+            web.get('/events/ws', self.stream_ws)
+        ])
+
+    @property
+    def consumers(self) -> int: return len(self._consumers)
+
+    async def start(self, host: str, port: int) -> None:
+        self.cursor = await database.get_log_cursor(self.db)
+
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        logger.info(f'Release stream listening on http://{host}:{port}.')
+
+    async def stop(self) -> None:
+        for queue in list(self._consumers): # Ends open streams, so shutting down doesn't wait on them
+            self._disconnect(queue)
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def notify(self) -> None:
+        """Pushes events logged since the last notification to every consumer."""
+        while True:
+            rows = await database.get_log(self.db, self.cursor, PAGE_SIZE)
+            if len(rows) == 0:
+                return
+
+            for row in rows:
+                event = format_event(row)
+                self.cursor = event['cursor']
+                for queue in list(self._consumers):
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull: # Too slow, disconnect it instead of buffering without limit
+                        self._disconnect(queue)
+
+    def _disconnect(self, queue: asyncio.Queue) -> None:
+        self._consumers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def _parse_cursor(self, value: Optional[str]) -> int:
+        if value is None:
+            return self.cursor # Only new events
+
+        try:
+            return max(int(value), 0)
+        except ValueError:
+            raise web.HTTPBadRequest(text='cursor must be an integer')
+
+    async def _events(self, after: int):
+        """Yields events after a cursor, replaying logged ones before following live ones."""
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self._consumers.add(queue) # Subscribe before replaying, so nothing is missed in between
+
+        try:
+            while after < self.cursor:
+                rows = await database.get_log(self.db, after, PAGE_SIZE)
+                if len(rows) == 0:
+                    break
+
+                for row in rows:
+                    after = row[0]
+                    yield format_event(row)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield None # Keep-alive
+                    continue
+
+                if event is None: # Disconnected for falling behind or shutting down
+                    return
+
+                if event['cursor'] > after:
+                    after = event['cursor']
+                    yield event
+        finally:
+            self._consumers.discard(queue)
+
+    async def get_releases(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'cursor': self.cursor,
+            'sources': {
+                source: [{'kind': type(_).__name__, **_.to_dict()} for _ in releases]
+                for source, releases in self.releases().items()
+            }
+        })
+
+    async def get_events(self, request: web.Request) -> web.Response:
+        after = self._parse_cursor(request.query.get('cursor', '0'))
+        events = [format_event(_) for _ in await database.get_log(self.db, after, PAGE_SIZE)]
+
+        return web.json_response({
+            'cursor': events[-1]['cursor'] if len(events) > 0 else after,
+            'events': events
+        })
+
+    async def stream_sse(self, request: web.Request) -> web.StreamResponse:
+        after = self._parse_cursor(request.headers.get('Last-Event-ID', request.query.get('cursor')))
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache'
+        })
+        await response.prepare(request)
+
+        try:
+            async for event in self._events(after):
+                if event is None:
+                    await response.write(b': keep-alive\n\n')
+                else:
+                    await response.write(f"id: {event['cursor']}\nevent: release\ndata: {json.dumps(event)}\n\n".encode())
+        except ConnectionResetError: # Consumer went away
+            pass
+
+        return response
+
+    async def stream_ws(self, request: web.Request) -> web.WebSocketResponse:
+        after = self._parse_cursor(request.query.get('cursor'))
+
+        ws = web.WebSocketResponse(heartbeat=HEARTBEAT)
+        await ws.prepare(request)
+
+        # Reading handles the consumer's close frame, sending stops as soon as it arrives
+        reader = asyncio.create_task(self._read_ws(ws))
+        sender = asyncio.create_task(self._send_ws(ws, after))
+        try:
+            await asyncio.wait((reader, sender), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            reader.cancel()
+            sender.cancel()
+            await ws.close()
+
+        return ws
+
+    async def _read_ws(self, ws: web.WebSocketResponse) -> None:
+        async for _ in ws: # Consumers don't send anything, messages are ignored
+            pass
+
+    async def _send_ws(self, ws: web.WebSocketResponse, after: int) -> None:
+        try:
+            async for event in self._events(after):
+                if event is not None:
+                    await ws.send_json(event)
+        except ConnectionResetError:
+            pass
@@ -1,30 +1,75 @@
 # imports
 from . import api
+from .icons import icons
 from datetime import datetime
 from pytz import timezone as tz
-from typing import Optional, List, Union
+from typing import Optional
 
-import aiohttp
-import bs4
 import discord
-import json
+import re
+
+# Splits an RSS title such as 'iOS 17.1 (21B74)' into its type, version & build number
+TITLE_PATTERN = re.compile(r'(?P<version>(?P<type>\S*).*?)(?: \((?P<build>[^)]*)\).*)?', re.DOTALL)
+PACIFIC = tz('US/Pacific')
+
+class Record():
+    """Base for immutable, slotted records. Subclasses assign fields with `_set` in `__init__`."""
+    __slots__ = ()
+
+    def _set(self, name: str, value) -> None: object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value) -> None: raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name: str) -> None: raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def to_dict(self) -> dict:
+        """Public fields as JSON-serializable values, enough to rebuild the record with `from_dict`."""
+        return {_: getattr(self, _) for _ in self.__slots__ if not _.startswith('_')}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Rebuilds a record from `to_dict`'s output without parsing it again."""
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            value = data.get(name)
+            record._set(name, tuple(value) if isinstance(value, list) else value)
+
+        return record
+
+
+class OtherRelease(Record):
+    __slots__ = ('build', 'type', 'firmware', 'models', 'zip', 'devices', 'name', 'xml', 'img', 'version', 'source')
 
-class OtherRelease():
     def __init__(self, dict: dict):
+        orig = dict.get('orig')
         # build number
-        self.build: str = dict.get('version')
+        self._set('build', dict.get('version'))
         # type
-        self.type: str = 'Other'
+        self._set('type', 'Other')
+        # firmware version
+        self._set('firmware', dict.get('firmware'))
+        # device/model identifiers the build ships for
+        self._set('models', tuple(dict.get('models', ())))
         # release zip
-        self.zip: str = dict.get('zip')
+        self._set('zip', dict.get('zip'))
+        # supported devices
+        self._set('devices', tuple(dict.get('devices', ())))
         # name
-        self.name: str = dict.get('orig').get('name')
+        self._set('name', orig.name)
         # xml
-        self.xml: str = dict.get('orig').get('xml')
+        self._set('xml', orig.url)
         # image
-        self.img: str = dict.get('orig').get('img')
+        self._set('img', orig.img)
         # version
-        self.version: str = f'{self.name} {self.build}'
+        self._set('version', f'{self.name} {self.build}')
+        # source
+        self._set('source', self.name)
+
+    @property
+    def fingerprint(self) -> tuple[str, str, Optional[str], str]: return (self.type, self.version, self.build if self.firmware is None else f'{self.build} {self.firmware}', self.source)
+
+    @property
+    def digest(self) -> int: return hash((self.zip, self.img, self.models, self.devices))
     
     async def ping(self, bot: discord.Bot, guild: discord.Guild) -> Optional[str]:
         """Formats the mention of the appropriate role for a release.
@@ -35,35 +80,45 @@ class OtherRelease():
         Returns:
             Pre-formatted role mention.
         """
-        async with bot.db.execute('SELECT data FROM roles WHERE guild = ?', (guild.id,)) as cursor:
-            roles = json.loads((await cursor.fetchone())[0])
+        roles = await bot.guild_config.get(guild.id)
 
         return guild.get_role(roles['Other'].get('role')).mention
 
-class Release():
-    def __init__(self, rss: dict):
-        # session
-        self.session = aiohttp.ClientSession()
-        # Raw RSS
-        self._rss = rss
+class Release(Record):
+    __slots__ = ('type', 'version', 'build_number', 'link', 'description', 'pubdate', 'source', '_date')
+
+    def __init__(self, rss: dict, source: str):
+        title = TITLE_PATTERN.fullmatch(rss.get('title'))
+        valid = title['type'] in api.VALID_RELEASES
         # Release Type
-        self.type: str = rss.get('title').split()[0] if rss.get('title').split()[0] in api.VALID_RELEASES else 'Other'
+        self._set('type', title['type'] if valid else 'Other')
         # Version
-        self.version: str = self.__format_version()
+        self._set('version', title['version'])
         # Build number
-        self.build_number: Optional[str] = self.__format_build_number() if rss.get('title').split()[0] in api.VALID_RELEASES else None
+        self._set('build_number', title['build'].replace(' | ', '') if valid and title['build'] is not None else None)
         # Link
-        self.link: str = rss.get('link')
+        self._set('link', rss.get('link'))
         # Description
-        self.description: str = rss.get('description')
-        # Release date
-        self.date: datetime = self.__format_date()
+        self._set('description', rss.get('description'))
+        # Raw publish date, parsed on first access to `date`
+        self._set('pubdate', rss.get('pubdate'))
+        self._set('_date', None)
+        # Source
+        self._set('source', source)
+
+    @property
+    def date(self) -> datetime:
+        """Release date, parsed on first access."""
+        if self._date is None:
+            self._set('_date', PACIFIC.localize(datetime.strptime(self.pubdate[:-4], '%a, %d %b %Y %H:%M:%S')))
 
-    def __format_build_number(self) -> str: return self._rss.get('title').split('(')[1].split(')')[0].replace(' | ', '')
+        return self._date
 
-    def __format_version(self) -> str: return self._rss.get('title').split(' (')[0]
+    @property
+    def fingerprint(self) -> tuple[str, str, Optional[str], str]: return (self.type, self.version, self.build_number, self.source)
 
-    def __format_date(self) -> datetime: return tz('US/Pacific').localize(datetime.strptime(self._rss.get('pubdate')[:-4], '%a, %d %b %Y %H:%M:%S'))
+    @property
+    def digest(self) -> int: return hash((self.link, self.description, self.pubdate))
 
     async def get_icon(self) -> str:
         """Gets the icon for the release.
@@ -71,15 +126,7 @@ class Release():
         Returns:
             Icon URL.
         """
-        try:
-            return getattr(self, '__icon')
-        except AttributeError:
-            pass
-        
-        resp = await self.session.get(self.link)
-        self.__icon = bs4.BeautifulSoup(await resp.text(), features='html.parser').findAll(attrs={'property': 'og:image'})[0]['content']
-        self.session.close()
-        return self.__icon
+        return await icons.fetch(self.link)
 
     async def ping(self, bot: discord.Bot, guild: discord.Guild) -> Optional[str]:
         """Formats the mention of the appropriate role for a release.
@@ -90,16 +137,21 @@ class Release():
         Returns:
             Pre-formatted role mention.
         """
-        async with bot.db.execute('SELECT data FROM roles WHERE guild = ?', (guild.id,)) as cursor:
-            roles = json.loads((await cursor.fetchone())[0])
+        roles = await bot.guild_config.get(guild.id)
 
         for os in roles.keys():
             if os == self.type:
                 return guild.get_role(roles[os].get('role')).mention
 
-class ComparedFirmwares():
-    def __init__(self, diff, fetched):
-        # Firmware differences
-        self.differences: List[Union[Release, OtherRelease]] = diff
-        # Fetched firmwares
-        self.firmwares: List[Union[Release, OtherRelease]] = fetched
\ No newline at end of file
+class SourceStatus():
+    def __init__(self, name: str, url: str, ok: bool, elapsed: float, error: Optional[str]=None):
+        # Source name
+        self.name: str = name
+        # Source URL
+        self.url: str = url
+        # Whether the fetch succeeded
+        self.ok: bool = ok
+        # Seconds spent fetching
+        self.elapsed: float = elapsed
+        # Error message, if the fetch failed
+        self.error: Optional[str] = error
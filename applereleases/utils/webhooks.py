@@ -0,0 +1,109 @@
+# imports
+from .client import http
+from .logger import logger
+from discord.errors import HTTPException, NotFound
+from typing import Optional
+
+import asyncio
+import discord
+import os
+
+# Announce through a webhook per channel instead of channel.send, enabled with AR_DELIVERY=webhook
+ENABLED = os.environ.get('AR_DELIVERY', 'channel') == 'webhook'
+WEBHOOK_NAME = 'Apple Releases'
+
+class WebhookDelivery():
+    """Sends announcements through one webhook per channel, falling back to `channel.send` where webhooks can't be used.
+
+    Webhooks are rate limited separately from the bot, so announcements don't compete with interactions,
+    and are posted through the pooled HTTP session rather than the gateway client.
+    """
+    def __init__(self, bot: discord.Bot):
+        self.bot = bot
+        # Channel ID -> webhook
+        self._webhooks: dict[int, discord.Webhook] = dict()
+        # Stops concurrent sends to a channel from creating more than one webhook
+        self._locks: dict[int, asyncio.Lock] = dict()
+        # Channels without webhook permissions, announced in with channel.send
+        self.fallback: set[int] = set()
+        # Messages sent through webhooks
+        self.sent: int = 0
+        # Messages sent with channel.send instead
+        self.fallbacks: int = 0
+
+    async def webhook(self, guild: discord.Guild, channel: discord.TextChannel) -> Optional[discord.Webhook]:
+        """Gets the webhook for a channel, reusing or creating one if none is stored.
+
+        Args:
+            guild (discord.Guild): Guild the channel is in.
+            channel (discord.TextChannel): Channel to announce in.
+        Returns:
+            The channel's webhook, or None if webhooks can't be used in it.
+        """
+        if channel.id in self.fallback:
+            return
+
+        if channel.id in self._webhooks:
+            return self._webhooks[channel.id]
+
+        async with self._locks.setdefault(channel.id, asyncio.Lock()):
+            if channel.id in self._webhooks:
+                return self._webhooks[channel.id]
+
+            stored = self.bot.guild_config.webhook(channel.id)
+            if stored is None:
+                if not channel.permissions_for(guild.me).manage_webhooks:
+                    logger.warning(f"Missing 'Manage Webhooks' in channel: #{channel.name} in guild: {guild.name}, announcing with regular messages.")
+                    self.fallback.add(channel.id)
+                    return
+
+                try:
+                    webhook = next((_ for _ in await channel.webhooks() if _.user is not None and _.user.id == self.bot.user.id and _.token is not None), None)
+                    if webhook is None:
+                        webhook = await channel.create_webhook(name=WEBHOOK_NAME, reason='Used to announce Apple releases')
+                except HTTPException as e: # Missing permissions or the channel's webhook limit was reached
+                    logger.warning(f'Unable to create a webhook in channel: #{channel.name} in guild: {guild.name} with error: {e!r}, announcing with regular messages.')
+                    self.fallback.add(channel.id)
+                    return
+
+                await self.bot.guild_config.set_webhook(guild.id, channel.id, webhook.id, webhook.token)
+                stored = (webhook.id, webhook.token)
+
+            self._webhooks[channel.id] = discord.Webhook.partial(*stored, session=http.api_session)
+
+        return self._webhooks[channel.id]
+
+    async def forget(self, channel: int) -> None:
+        """Drops a channel's webhook, a new one is created on the next send.
+
+        Args:
+            channel (int): Channel ID.
+        """
+        self._webhooks.pop(channel, None)
+        await self.bot.guild_config.remove_webhook(channel)
+
+    async def send(self, guild: discord.Guild, channel: discord.TextChannel, payload: dict, nonce: Optional[str]=None) -> None:
+        """Sends a message through the channel's webhook, or with `channel.send` if there isn't one.
+
+        Args:
+            guild (discord.Guild): Guild the channel is in.
+            channel (discord.TextChannel): Channel to announce in.
+            payload (dict): Keyword arguments for `channel.send`.
+            nonce (str): Idempotency key, only honoured by `channel.send` as webhooks don't take one.
+        """
+        webhook = await self.webhook(guild, channel)
+        if webhook is not None:
+            try:
+                await webhook.send(**payload, username=self.bot.user.name, avatar_url=str(self.bot.user.display_avatar.with_static_format('png').url))
+                self.sent += 1
+
+                return
+            except NotFound: # Webhook was deleted
+                logger.warning(f'Webhook for channel: #{channel.name} in guild: {guild.name} no longer exists, announcing with a regular message.')
+                await self.forget(channel.id)
+
+        if nonce is not None:
+            await channel.send(**payload, nonce=nonce, enforce_nonce=True)
+        else:
+            await channel.send(**payload)
+        self.fallbacks += 1
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Benchmarks diffing release catalogs through the fingerprint index against the previous per-release filter.
+
+Run from the repository root: python -m benchmarks.diff_bench
+"""
+
+# imports
+from applereleases.utils.api import format_feed
+from applereleases.utils.diff import diff_releases
+from applereleases.utils.types import Release
+
+import time
+
+# Catalog sizes benchmarked
+SIZES = (1000, 10000, 50000)
+# Releases added to & removed from the new catalog
+CHURN = 10
+# Above this size the previous filter takes minutes, so it's skipped
+FILTER_LIMIT = 10000
+
+def make_catalog(start: int, size: int) -> list[Release]:
+    return format_feed([{
+        'title': f'iOS 17.{i} ({21000 + i}a)',
+        'link': f'https://developer.apple.com/news/releases/?id={i}',
+        'description': f'Release {i}',
+        'pubdate': 'Mon, 06 Nov 2023 10:00:00 PST'
+    } for i in range(start, start + size)], 'Developer Releases')
+
+def filter_diff(old: list[Release], new: list[Release]) -> list[Release]:
+    """The previous comparison, filtering the old catalog for every new release."""
+    return [release for release in new if list(filter(lambda x: x.version == release.version, old)) == []]
+
+def timed(function, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+def main():
+    for size in SIZES:
+        old = make_catalog(0, size)
+        new = make_catalog(CHURN, size) # Drops the first CHURN releases & adds CHURN new ones
+
+        elapsed, diff = timed(diff_releases, old, new)
+        assert len(diff.added) == CHURN and len(diff.removed) == CHURN and len(diff.changed) == 0
+        line = f'n={size}: indexed {elapsed:.1f} ms'
+
+        if size <= FILTER_LIMIT:
+            elapsed, added = timed(filter_diff, old, new)
+            assert [_.fingerprint for _ in added] == [_.fingerprint for _ in diff.added]
+            line += f', previous filter {elapsed:.1f} ms'
+
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Benchmarks building a polled feed into Release records against the previous, eagerly parsed records.
+
+Checks that records are slotted & immutable and that publish dates are only parsed when read.
+Run from the repository root: python -m benchmarks.release_bench
+"""
+
+# imports
+from applereleases.utils.api import VALID_RELEASES, format_feed
+from applereleases.utils.parsers import parse_rss
+from applereleases.utils.types import Release
+from datetime import datetime
+from pathlib import Path
+from pytz import timezone as tz
+from typing import Optional
+
+import timeit
+import tracemalloc
+
+# Recorded feed, see benchmarks/rss_bench.py
+FIXTURE = Path(__file__).parent / 'fixtures' / 'releases.rss'
+SOURCE = 'Developer Releases'
+ROUNDS = 500
+
+class PreviousRelease():
+    """The previous record, keeping the raw entry & parsing the date up front."""
+    def __init__(self, rss: dict, source: str):
+        self._rss = rss
+        self.type: str = rss.get('title').split()[0] if rss.get('title').split()[0] in VALID_RELEASES else 'Other'
+        self.version: str = self._rss.get('title').split(' (')[0]
+        self.build_number: Optional[str] = self._rss.get('title').split('(')[1].split(')')[0].replace(' | ', '') if rss.get('title').split()[0] in VALID_RELEASES else None
+        self.link: str = rss.get('link')
+        self.description: str = rss.get('description')
+        self.date: datetime = tz('US/Pacific').localize(datetime.strptime(self._rss.get('pubdate')[:-4], '%a, %d %b %Y %H:%M:%S'))
+        self.source: str = source
+
+    @property
+    def fingerprint(self) -> tuple[str, str, Optional[str], str]: return (self.type, self.version, self.build_number, self.source)
+
+def poll(feed: list[dict], build) -> list[tuple]:
+    """What a poll does with every entry: build its record & fingerprint it."""
+    return [_.fingerprint for _ in build(feed)]
+
+def retained(feed: list[dict], build) -> int:
+    """Bytes held by the records built from a feed."""
+    tracemalloc.start()
+    records = build(feed)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return size
+
+def check(feed: list[dict]) -> None:
+    releases = format_feed(feed, SOURCE)
+    previous = [PreviousRelease(_, SOURCE) for _ in feed]
+    assert [_.fingerprint for _ in releases] == [_.fingerprint for _ in previous]
+
+    release = releases[0]
+    assert not hasattr(release, '__dict__')
+    for action in (lambda: setattr(release, 'version', 'iOS 99'), lambda: delattr(release, 'link'), lambda: setattr(release, 'extra', 1)):
+        try:
+            action()
+        except AttributeError:
+            continue
+
+        raise AssertionError('Release records must be immutable')
+
+    # Fingerprinting never parses the date, reading it parses it once
+    assert all(_._date is None for _ in releases)
+    assert release.date == previous[0].date
+    assert release.date is release._date
+
+def main():
+    feed = parse_rss(FIXTURE.read_bytes())
+    check(feed)
+
+    builds = {
+        'previous': lambda feed: [PreviousRelease(_, SOURCE) for _ in feed],
+        'slotted': lambda feed: format_feed(feed, SOURCE)
+    }
+    for name, build in builds.items():
+        elapsed = timeit.timeit(lambda: poll(feed, build), number=ROUNDS) / ROUNDS
+        print(f'{name}: {elapsed * 1e6:.0f} us per poll, {retained(feed, build) / 1024:.1f} KiB retained ({len(feed)} entries)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmarks parsing the developer RSS feed with lxml against the previous BeautifulSoup parser.
+
+Checks that parsing stops at the first known entry and that merging in the known entries keeps the feed's length.
+Run from the repository root: python -m benchmarks.rss_bench
+"""
+
+# imports
+from applereleases.utils.parsers import parse_rss
+from pathlib import Path
+
+import re
+import timeit
+
+try:
+    import bs4
+except ImportError: # Only needed for the comparison
+    bs4 = None
+
+# Recorded feed, newest entry first
+FIXTURE = Path(__file__).parent / 'fixtures' / 'releases.rss'
+# Entries published since the fixture was recorded
+NEW_ENTRIES = 2
+ROUNDS = 200
+
+def parse_rss_bs4(body: bytes) -> list[dict]:
+    """The previous parser, building the whole document tree."""
+    soup = bs4.BeautifulSoup(body, features='xml')
+
+    return [
+        {
+            'title': a.find('title').text,
+            'link': a.find('link').text,
+            'description': a.find('description').text,
+            'pubdate': a.find('pubDate').text
+        }
+        for a in soup.find_all('item')
+    ]
+
+def publish(body: bytes, count: int) -> bytes:
+    """Returns the feed after `count` new entries are published, the oldest ones falling off the end."""
+    items = re.findall(rb'    <item>.*?</item>\n', body, re.DOTALL)
+    new = [
+        items[0].replace(b'?id=', b'?id=new%d-' % i).replace(b'<title>', b'<title>New %d ' % i)
+        for i in range(count)
+    ]
+
+    head, tail = body.split(items[0], 1)
+    return head + b''.join(new + items[:-count]) + tail.split(items[-1], 1)[1]
+
+def bench(name: str, function, *args) -> None:
+    elapsed = timeit.timeit(lambda: function(*args), number=ROUNDS) / ROUNDS
+    print(f'{name}: {elapsed * 1000:.2f} ms')
+
+def main():
+    body = FIXTURE.read_bytes()
+    known = parse_rss(body)
+    assert len(known) == 50 and all(_['guid'] is not None and _['pubdate'] is not None for _ in known)
+
+    updated = publish(body, NEW_ENTRIES)
+    full = parse_rss(updated)
+    merged = parse_rss(updated, known=known)
+
+    # Merging keeps the feed's length & gives the same entries as a full parse
+    assert len(merged) == len(full) == len(known)
+    assert merged == full
+    # Parsing stopped at the watermark, everything after it is the known entries themselves
+    assert all(a is b for a, b in zip(merged[NEW_ENTRIES:], known))
+    # An unchanged feed stops at its first entry
+    assert all(a is b for a, b in zip(parse_rss(body, known=known), known))
+
+    if bs4 is not None:
+        assert [{k: v for k, v in _.items() if k != 'guid'} for _ in full] == parse_rss_bs4(updated)
+        bench('BeautifulSoup (previous)', parse_rss_bs4, updated)
+    else:
+        print('BeautifulSoup not installed, skipping the comparison')
+
+    bench('lxml iterparse, full', parse_rss, updated)
+    bench('lxml iterparse, stopped at watermark', parse_rss, updated, known)
+
+if __name__ == '__main__':
+    main()